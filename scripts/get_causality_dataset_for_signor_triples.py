@@ -1,148 +1,212 @@
 import os
 import sys
-import json
-import shutil
-import pandas as pd
-from indra.statements.agent import default_ns_order
+import click
 
 import causal_precedence_training.locations as loc
+from causal_precedence_training.cache import DEFAULT_CACHE_PATH, \
+    LOCAL_SNAPSHOT_CACHE_PATH, QueryCache
+from causal_precedence_training.checkpoint import CheckpointStore, FOUND, \
+    NONE, UNGROUNDED
+from causal_precedence_training.parallel import run_triples
 from causal_precedence_training.reach_output import \
-    get_reach_causality_dataframe_for_triple, get_readings_for_reading_ids
+    get_reach_causality_dataframe_for_triples
+from causal_precedence_training.sentence_index import SENTENCE_INDEX_CACHE
+from causal_precedence_training.export import export_reach_outputs
+from causal_precedence_training.metrics import METRICS, profile_call
+from causal_precedence_training.query_indra_db import get_backend, \
+    get_cache, set_cache
+from causal_precedence_training.sharding import assign_shards, \
+    get_shard_suffix, get_triple_costs
+from causal_precedence_training.snapshot import use_local_snapshot
+from causal_precedence_training.triples import read_triples
 
 
+CHECKPOINT_COLUMNS = ['signor_stmt1', 'signor_stmt2',
+                      'agent1_name', 'agent1', 'stmt_type1',
+                      'agent2_name', 'agent2', 'stmt_type2',
+                      'agent3_name', 'agent3', 'text1', 'text2',
+                      'sentence_id1', 'sentence_id2', 'reading_id']
 
-def curie_from_db_refs(db_refs):
-    """Get curie for highest priority namespace in db_refs dict 
-    
-    Parameters
-    ----------
-    db_refs : dict
-        An INDRA style db_refs dict mapping namespaces to identifiers
 
-    Returns
-    -------
-    curie : str
-        A curie of the form f'{namespace}:{identifier}' associated to
-        the db_refs entry with namespace highest in the priority list
-        default_ns_order taken from `indra.statements.agent`. Chooses
-        a random db_refs entry for namespaces that do not appear in the
-        priority list. Returns None if given an empty db_refs dict.
-    """
-    for namespace in default_ns_order:
-        if namespace in db_refs:
-            return f'{namespace}:{db_refs[namespace]}'
-    if db_refs:
-        # If db_refs has no namespaces from priority list, just return a
-        # random one
-        ns, id_ = list(db_refs.items())[0]
-        return f'{ns}:{id_}'
-    return None
-
-
-if __name__ == '__main__':
+@click.command()
+@click.option('--workers', default=4, show_default=True,
+              help='Number of batches of triples to query concurrently.')
+@click.option('--batch-size', default=50, show_default=True,
+              help='Number of triples to query together in each batch.')
+@click.option('--cache/--no-cache', default=True, show_default=True,
+              help='Keep results of database lookups in a persistent'
+                   ' on-disk cache.')
+@click.option('--db-snapshot', default=None,
+              help='Version of the indra_db snapshot being queried. The'
+                   ' cache is cleared if it was filled from another'
+                   ' version.')
+@click.option('--local-snapshot', default=None,
+              help='Path to a local snapshot of indra_db to query instead'
+                   ' of the live database.')
+@click.option('--metrics', 'metrics_path', default=None,
+              help='Path to write per-stage and per-triple metrics to as'
+                   ' json lines.')
+@click.option('--profile-indices', default=None,
+              help='Comma separated indices of triples to run under cProfile'
+                   ' before the main run.')
+@click.option('--profile-output', default='signor_triples.prof',
+              show_default=True,
+              help='Path to dump cProfile stats for --profile-indices to.')
+@click.option('--shard', default=0, show_default=True,
+              help='Index of the shard of triples to handle on this node.')
+@click.option('--num-shards', default=1, show_default=True,
+              help='Number of shards the triples are split into.')
+@click.option('--balance/--no-balance', default=True, show_default=True,
+              help='Balance shards by a pre-count of the readings'
+                   ' supporting each triple rather than by triple hash'
+                   ' alone. All nodes must query the same database'
+                   ' snapshot.')
+def main(workers, batch_size, cache, db_snapshot, local_snapshot,
+         metrics_path, profile_indices, profile_output, shard, num_shards,
+         balance):
+    if not 0 <= shard < num_shards:
+        raise click.BadParameter(f'must be between 0 and {num_shards - 1}',
+                                 param_hint='--shard')
+    if local_snapshot:
+        use_local_snapshot(local_snapshot)
+    if metrics_path:
+        METRICS.set_output(metrics_path)
+    if cache:
+        # Results from local snapshots are kept apart from those of the
+        # live database, so switching between them doesn't clear either
+        cache_path = LOCAL_SNAPSHOT_CACHE_PATH if local_snapshot \
+            else DEFAULT_CACHE_PATH
+        set_cache(QueryCache(cache_path, snapshot=db_snapshot,
+                             backend=get_backend()))
     all_results_path = os.path.join(loc.TRAINING_DATA_EXPORT_DIRECTORY,
                                     'signor_training_data')
-    # Results for each individual triple are stored in the temp folder.
-    # In case of an error, script can be restarted and the results
-    # which had already been computed can be pulled from this folder
-    temp_results_path = os.path.join(all_results_path, 'temp')
-    if not os.path.exists(temp_results_path):
-        os.makedirs(temp_results_path)
-    completed = set(os.listdir(temp_results_path))
+    if not os.path.exists(all_results_path):
+        os.makedirs(all_results_path)
+    # Outputs of each shard are kept apart so that nodes can share a
+    # directory. Merge them with causal_precedence_training.sharding.
+    suffix = get_shard_suffix(shard, num_shards) if num_shards > 1 else ''
+    # Results for each individual triple are recorded in a checkpoint store
+    # along with whether any were found. In case of an error, script can be
+    # restarted and the triples which had already been handled are skipped.
+    checkpoint_path = os.path.join(all_results_path,
+                                   f'checkpoint{suffix}.sqlite')
+    store = CheckpointStore(checkpoint_path, CHECKPOINT_COLUMNS)
+    completed = store.get_completed()
     try:
-        signor_triples_df = pd.\
-            read_pickle(os.path.join(loc.TRIPLES_DIRECTORY,
-                                     'signor_causal_triples.pkl'))
+        signor_triples_df = read_triples(
+            os.path.join(loc.TRIPLES_DIRECTORY,
+                         'signor_causal_triples.parquet'),
+            columns=['agent1', 'agent2', 'agent3', 'agent1_name',
+                     'agent2_name', 'agent3_name', 'statement1',
+                     'statement2'])
     except FileNotFoundError:
         print('Signor Triples have not been generated. First run the script'
               ' get_signor_causal_triples.py')
         sys.exit(1)
-    for index, row in signor_triples_df.iterrows():
-        results_path = os.path.join(temp_results_path, f'triple_{index}')
-        statement1, statement2 = row['statement1'], row['statement2']
-        if f'triple_{index}' in completed:
+    # Curies are None for ungrounded agents
+    signor_triples_df = signor_triples_df.astype(object).where(
+        signor_triples_df.notna(), None)
+    names = dict(zip(signor_triples_df.index,
+                     zip(signor_triples_df.agent1_name,
+                         signor_triples_df.agent2_name,
+                         signor_triples_df.agent3_name)))
+    candidates = list(zip(signor_triples_df.index,
+                          signor_triples_df.statement1,
+                          signor_triples_df.statement2,
+                          zip(signor_triples_df.agent1,
+                              signor_triples_df.agent2,
+                              signor_triples_df.agent3)))
+    if num_shards > 1:
+        # Shards are assigned from all triples, including those already
+        # completed, so that every node and every restart agrees on them.
+        costs = get_triple_costs(
+            triple for _, _, _, triple in candidates
+            if None not in triple) if balance else None
+        shards = assign_shards((triple for _, _, _, triple in candidates),
+                               num_shards, costs)
+        candidates = [candidate for candidate in candidates
+                      if shards[candidate[3]] == shard]
+        print(f'Handling {len(candidates)} triples in shard {shard} of'
+              f' {num_shards}')
+    pending = []
+    for index, statement1, statement2, triple in candidates:
+        if index in completed:
             print('Results already computed for'
                         f' {statement1}, {statement2}')
             continue
-        print(f'Working on {statement1}, {statement2}')
-        agent1 = statement1.subj
-        agent2 = statement1.obj
-        agent3 = statement2.obj
-        curie1 = curie_from_db_refs(agent1.db_refs)
-        curie2 = curie_from_db_refs(agent2.db_refs)
-        curie3 = curie_from_db_refs(agent3.db_refs)
-        if curie1 is None:
-            print(f'Ungrounded agent {agent1} with db_refs'
-                           f'{ agent1.db_refs}')
-        if curie2 is None:
-            print(f'Ungrounded agent {agent2} with db_refs'
-                           f'{ agent2.db_refs}')
-        if curie3 is None:
-            print(f'Ungrounded agent {agent3} with db_refs'
-                           f'{ agent3.db_refs}')
-        if any(curie is None for curie in (curie1, curie2, curie3)):
-            # We use the existence of directory as sign that results have
-            # already been computed. We need to create it even if no results
-            # were found.
-            if not os.path.exists(results_path):
-                os.makedirs(results_path)
+        for curie, name in zip(triple, names[index]):
+            if curie is None:
+                print(f'Ungrounded agent {name} in {statement1},'
+                      f' {statement2}')
+        if any(curie is None for curie in triple):
+            store.record(index, UNGROUNDED)
             continue
-        df = get_reach_causality_dataframe_for_triple(curie1, curie2, curie3)
+        pending.append((index, statement1, statement2, triple))
+
+    if profile_indices:
+        profile_indices = {int(index) for index in profile_indices.split(',')}
+        profile_call(profile_output,
+                     get_reach_causality_dataframe_for_triples,
+                     [triple for index, _, _, triple in pending
+                      if index in profile_indices])
+        print(f'Wrote profile for triples {sorted(profile_indices)} to'
+              f' {profile_output}')
+
+    # Triples are queried concurrently in batches, but results come back in
+    # the order of the input so they can be checkpointed as they arrive.
+    results = run_triples((triple for _, _, _, triple in pending),
+                          n_workers=workers, batch_size=batch_size)
+    for (index, statement1, statement2, _), (_, df) in zip(pending,
+                                                           results):
         if df is None:
-            # We use the existence of directory as sign that results have
-            # already been computed. We need to create it even if no results
-            # were found.
-            if not os.path.exists(results_path):
-                os.makedirs(results_path)
+            store.record(index, NONE)
             print(f'No results found for {statement1}, {statement2}')
             continue
         print(f'Results found for {statement1}, {statement2}')
-        df['agent1_name'] = agent1.name
-        df['agent2_name'] = agent2.name
-        df['agent3_name'] = agent3.name
-        df['signor_stmt1'] = statement1.__str__()
-        df['signor_stmt2'] = statement2.__str__()
-        df = df[['signor_stmt1', 'signor_stmt2', 
-                 'agent1_name', 'agent1', 'stmt_type1',
-                 'agent2_name', 'agent2', 'stmt_type2',
-                 'agent3_name', 'agent3', 'text1', 'text2',
-                 'sentence_id1', 'sentence_id2', 'reading_id']]
-        results_path = os.path.join(temp_results_path, f'triple_{index}')
-        if not os.path.exists(results_path):
-            os.makedirs(results_path)
-        df.to_csv(os.path.join(results_path, 'dataset'), sep=',', index=False)
+        df['agent1_name'], df['agent2_name'], df['agent3_name'] = \
+            names[index]
+        df['signor_stmt1'] = statement1
+        df['signor_stmt2'] = statement2
+        store.record(index, FOUND, df)
 
-    all_dfs = []
-    for directory in os.listdir(temp_results_path):
-        triplet_directory = os.path.join(temp_results_path, directory)
-        if os.listdir(triplet_directory):
-            df = pd.read_csv(os.path.join(triplet_directory, 'dataset'), sep=',')
-            all_dfs.append(df)
+    # Assemble the final dataset a chunk at a time from the store
+    dataset_path = os.path.join(all_results_path,
+                                f'signor_triples_dataset{suffix}.csv')
+    for chunk_index, results_df in enumerate(store.iter_results()):
+        results_df['signor_stmt_type1'] = results_df.signor_stmt1.\
+            apply(lambda x: x.split('(')[0])
+        results_df['signor_stmt_type2'] = results_df.signor_stmt2.\
+            apply(lambda x: x.split('(')[0])
 
-    results_df = pd.concat(all_dfs)
-    reach_jsons = get_readings_for_reading_ids(results_df.reading_id.values)
+        results_df = results_df.rename({'stmt_type1': 'database_stmt_type1',
+                                        'stmt_type2': 'database_stmt_type2',
+                                        'text1': 'sentence_text1',
+                                        'text2': 'sentence_text2'},
+                                       axis=1)
 
-    results_df['signor_stmt_type1'] = results_df.signor_stmt1.\
-        apply(lambda x: x.split('(')[0])
-    results_df['signor_stmt_type2'] = results_df.signor_stmt2.\
-        apply(lambda x: x.split('(')[0])
+        results_df = results_df[['agent1_name', 'agent1', 'agent2_name',
+                                 'agent2', 'agent3_name', 'agent3',
+                                 'signor_stmt_type1', 'signor_stmt_type2',
+                                 'database_stmt_type1',
+                                 'database_stmt_type2', 'sentence_text1',
+                                 'sentence_text2', 'sentence_id1',
+                                 'sentence_id2', 'reading_id']]
+        results_df.to_csv(dataset_path, sep=',', index=False,
+                          mode='w' if chunk_index == 0 else 'a',
+                          header=chunk_index == 0)
+    # Stream the REACH output for each reading into the archive
+    export_reach_outputs(store.get_distinct_values('reading_id'),
+                         os.path.join(all_results_path,
+                                      f'signor_triples_dataset_reach_output'
+                                      f'{suffix}.tar.gz'))
+    store.close()
+    os.remove(checkpoint_path)
+    cache_stats = {'sentence_index': {'hits': SENTENCE_INDEX_CACHE.hits,
+                                      'misses': SENTENCE_INDEX_CACHE.misses}}
+    if cache:
+        cache_stats['query'] = get_cache().get_stats()
+    print(f'Run summary: {METRICS.write_summary(cache_stats)}')
 
-    results_df = results_df.rename({'stmt_type1': 'database_stmt_type1',
-                                    'stmt_type2': 'database_stmt_type2',
-                                    'text1': 'sentence_text1',
-                                    'text2': 'sentence_text2'},
-                                   axis=1)
 
-    results_df = results_df[['agent1_name', 'agent1', 'agent2_name', 'agent2',
-                             'agent3_name', 'agent3', 'signor_stmt_type1',
-                             'signor_stmt_type2', 'database_stmt_type1',
-                             'database_stmt_type2', 'sentence_text1',
-                             'sentence_text2', 'sentence_id1',
-                             'sentence_id2', 'reading_id']]
-    results_df.to_csv(os.path.join(all_results_path, 'signor_triples_dataset.csv'),
-                      sep=',', index=False)
-    with open(os.path.join(all_results_path,
-                           'signor_triples_dataset_reach_output.json'), 'w') \
-                           as f:
-        json.dump(reach_jsons, f, indent=True)
-    shutil.rmtree(temp_results_path)
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,17 @@
 import os
+import json
+import click
+import numpy as np
 import pandas as pd
-from copy import deepcopy
-from itertools import product
+from copy import copy
+from concurrent.futures import ThreadPoolExecutor
 from indra.sources import signor
 from collections import defaultdict
 from indra.statements import Activation, Inhibition
 
 from causal_precedence_training import locations
+from causal_precedence_training.triples import get_triples_table, \
+    write_triples
 
 
 def get_relevant_signor_statements():
@@ -27,121 +32,228 @@ def get_relevant_signor_statements():
     return signor_stmts_by_id
 
 
-def generate_signor_triples_dataframe(signor_stmts_by_id):
-    print('Generating dataframe of SIGNOR triples.')
-    SIGNOR_pathway_dfs = []
-    for pathway_filename in os.listdir(locations.SIGNOR_PATHWAYS_DIRECTORY):
-        filepath = os.path.join(locations.SIGNOR_PATHWAYS_DIRECTORY,
-                                pathway_filename)
+def load_pathway_edges(directory=locations.SIGNOR_PATHWAYS_DIRECTORY,
+                       n_workers=8):
+    """Load activations and inhibitions from all pathway files into one table
+
+    Files are read concurrently by a pool of threads.
+
+    Parameters
+    ----------
+    directory : Optional[str]
+        Directory holding SIGNOR pathway tsv files. Default:
+        locations.SIGNOR_PATHWAYS_DIRECTORY
+    n_workers : Optional[int]
+        Number of files to read at once. Default: 8
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with columns SIGNOR_ID, ENTITYA, ENTITYB and
+        pathway_filename, with a row for each edge of each pathway.
+    """
+    pathway_filenames = os.listdir(directory)
+
+    def _load(pathway_filename):
         # Load relevant columns of pathway tsv file
-        pathway_df = pd.read_csv(filepath, sep='\t', keep_default_na=False,
-                                 usecols=['SIGNOR_ID', 'ENTITYA', 'ENTITYB',
-                                          'EFFECT'])
-        # Filter to only activations and inhibitions
-        pathway_df = pathway_df[
-            pathway_df.EFFECT.isin(['up-regulates activity',
-                                    'down-regulates activity'])]
-        # Add column for INDRA statement associated to each edge in pathway
-        pathway_df['statement'] = pathway_df.SIGNOR_ID.\
-            apply(lambda x: signor_stmts_by_id[x][0])
-        # Pathway TSV files are inconsistent regarding naming of pathways.
-        # Some have column for the pathway name while others don't. Use the
-        # associated filename ot label each pathway since it is always
-        # present.
-        pathway_df['pathway_filename'] = pathway_filename
-        # Perform a self inner join from Object to Subject to collect causal
-        # triples from within the pathway.
-        pathway_df = pathway_df.\
-            merge(pathway_df, left_on='ENTITYB', right_on='ENTITYA',
-                  how='inner')
-        # Do some renaming to clean up column names after join
-        pathway_df.\
-            rename({'ENTITYA_x': 'signor_entity1',
+        return pd.read_csv(os.path.join(directory, pathway_filename),
+                           sep='\t', keep_default_na=False, dtype=str,
+                           usecols=['SIGNOR_ID', 'ENTITYA', 'ENTITYB',
+                                    'EFFECT'])
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        pathway_dfs = list(executor.map(_load, pathway_filenames))
+    # Pathway TSV files are inconsistent regarding naming of pathways.
+    # Some have column for the pathway name while others don't. Use the
+    # associated filename ot label each pathway since it is always
+    # present.
+    edges = pd.concat(pathway_dfs, ignore_index=True)
+    edges['pathway_filename'] = pd.Categorical(
+        np.repeat(pathway_filenames, [len(df) for df in pathway_dfs]),
+        categories=pathway_filenames)
+    # Filter to only activations and inhibitions
+    edges = edges[edges.EFFECT.isin(['up-regulates activity',
+                                     'down-regulates activity'])]
+    return edges.drop('EFFECT', axis=1)
+
+
+def generate_signor_triples_dataframe(signor_stmts_by_id,
+                                      all_pathways=False):
+    """Generate DataFrame of causal triples within SIGNOR pathways
+
+    Parameters
+    ----------
+    signor_stmts_by_id : dict
+        Dictionary mapping SIGNOR IDs to lists of associated statements as
+        returned by get_relevant_signor_statements.
+    all_pathways : Optional[bool]
+        If True, add a column pathway_filenames listing every pathway a
+        triple appears in. pathway_filename is always the first of them.
+        Default: False
+
+    Returns
+    -------
+    pandas.DataFrame
+        See expand_bound_conditions.
+    """
+    print('Generating dataframe of SIGNOR triples.')
+    edges = load_pathway_edges()
+    entities = ['signor_entity1', 'signor_entity2', 'signor_entity3']
+    # Perform a single self inner join from Object to Subject within each
+    # pathway to collect causal triples from all pathways at once.
+    df = edges.merge(edges, left_on=['pathway_filename', 'ENTITYB'],
+                     right_on=['pathway_filename', 'ENTITYA'], how='inner')
+    # Do some renaming to clean up column names after join
+    df = df.rename({'ENTITYA_x': 'signor_entity1',
                     'ENTITYA_y': 'signor_entity2',
-                    'ENTITYB_y': 'signor_entity3',
-                    'statement_x': 'statement1',
-                    'statement_y': 'statement2',
-                    'pathway_filename_x': 'pathway_filename'}, axis=1,
-                   inplace=True)
-        # Drop unnecessary columns
-        pathway_df.drop(['pathway_filename_y', 'ENTITYB_x',
-                         'SIGNOR_ID_x', 'SIGNOR_ID_y'], axis=1, inplace=True)
-        SIGNOR_pathway_dfs.append(pathway_df)
-    # Concatenate the rows of the dataframes together into one large dataframe
-    # Use shortname to make following filter more readable
-    df = pd.concat(SIGNOR_pathway_dfs)
+                    'ENTITYB_y': 'signor_entity3'}, axis=1)
     # Filter self edges and loops
     df = df[(df.signor_entity1 != df.signor_entity3) &
             (df.signor_entity1 != df.signor_entity2) &
             (df.signor_entity2 != df.signor_entity3)]
-    # Remove duplicate triples
-    df = df.groupby(['signor_entity1', 'signor_entity2',
-                     'signor_entity3'],
-                    as_index=False).first()
+    # Remove duplicate triples, keeping the first pathway each is found in
+    first_df = df.drop_duplicates(entities).\
+        sort_values(entities, kind='stable').reset_index(drop=True)
+    # Add columns for INDRA statements associated to each edge in triple
+    first_df['statement1'] = [signor_stmts_by_id[signor_id][0]
+                              for signor_id in first_df.SIGNOR_ID_x]
+    first_df['statement2'] = [signor_stmts_by_id[signor_id][0]
+                              for signor_id in first_df.SIGNOR_ID_y]
+    first_df['pathway_filename'] = \
+        first_df.pathway_filename.astype(str)
     # Change order of columns
-    df = df[['statement1', 'statement2', 'signor_entity1', 'signor_entity2',
-             'signor_entity3', 'pathway_filename']]
+    columns = ['statement1', 'statement2', *entities, 'pathway_filename']
+    if all_pathways:
+        pathways = df[entities + ['pathway_filename']].drop_duplicates().\
+            astype(str).groupby(entities)['pathway_filename'].agg(list).\
+            rename('pathway_filenames').reset_index()
+        first_df = first_df.merge(pathways, on=entities, how='left')
+        columns.append('pathway_filenames')
+    df = first_df[columns]
     print('Expanding bound conditions.')
-    # Expand bound conditions into multiple statements
-    # Pull out agents A->B->C from chain
-    df['A'] = df.statement1.apply(lambda x: x.subj)
-    df['B'] = df.statement1.apply(lambda x: x.obj)
-    df['C'] = df.statement2.apply(lambda x: x.obj)
-    # Add columns for bound agents if they exist
-    df['A_bound'] = df.A.apply(_get_bound_agent)
-    df['B_bound'] = df.B.apply(_get_bound_agent)
-    df['C_bound'] = df.C.apply(_get_bound_agent)
-    # Drop bound conditions from agent columns
-    df.loc[:, 'A'] = df.A.apply(_get_unbound_agent)
-    df.loc[:, 'B'] = df.B.apply(_get_unbound_agent)
-    df.loc[:, 'C'] = df.C.apply(_get_unbound_agent)
-
-    # I can't think of a better way than just iterating over the dataframe
-    new_rows = []
-    for _, row in df.iterrows():
-        for A, B, C in product([row['A'], row['A_bound']],
-                               [row['B'], row['B_bound']],
-                               [row['C'], row['C_bound']]):
-            if pd.isna(A) or pd.isna(B) or pd.isna(C):
-                continue
-            new_stmt1 = deepcopy(row['statement1'])
-            new_stmt2 = deepcopy(row['statement2'])
-            new_stmt1.subj, new_stmt1.obj = A, B
-            new_stmt2.subj, new_stmt2.obj = B, C
-            new_rows.append([new_stmt1, new_stmt2, row['signor_entity1'],
-                             row['signor_entity2'], row['signor_entity3'],
-                             row['pathway_filename']])
-
-    df = pd.DataFrame(new_rows,
-                      columns=['statement1', 'statement2', 'signor_entity1',
-                               'signor_entity2', 'signor_entity3',
-                               'pathway_filename'])
-    return df
-
-
-def _get_bound_agent(agent):
-    """Get first bound condition agent for an agent if one exists."""
-    if agent.bound_conditions:
-        return deepcopy(agent.bound_conditions[0].agent)
-    else:
-        return float('nan')
+    return expand_bound_conditions(df)
+
+
+def expand_bound_conditions(df):
+    """Expand the first bound condition of each agent into its own triple
+
+    Each of the agents A, B and C in a chain is either used without its
+    bound conditions or replaced by the agent of its first bound
+    condition, if it has one, giving up to 8 triples per chain. The
+    expansion is a cross join over integer keys of distinct agents, so
+    neither agents nor statements are copied here.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame with columns statement1 and statement2 holding the
+        statements A -> B and B -> C, and columns signor_entity1,
+        signor_entity2, signor_entity3 and pathway_filename.
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with the input columns statement1 and statement2 renamed
+        to signor_statement1 and signor_statement2, and with columns A, B
+        and C holding the agents for each expanded triple. Use
+        iter_expanded_statements to build the statements A -> B and
+        B -> C for each row.
+    """
+    agents = []
+    agent_keys = {}
+
+    def get_key(agent):
+        # Agents with the same name, groundings and state share a key
+        key = (agent.name, json.dumps(agent.db_refs, sort_keys=True),
+               agent.state_matches_key())
+        if key not in agent_keys:
+            agent_keys[key] = len(agents)
+            agents.append(agent)
+        return agent_keys[key]
+
+    df = df.reset_index(drop=True)
+    wide = pd.DataFrame({'row': df.index})
+    for role, role_agents in (('A', (stmt.subj for stmt in df.statement1)),
+                              ('B', (stmt.obj for stmt in df.statement1)),
+                              ('C', (stmt.obj for stmt in df.statement2))):
+        unbound_keys, bound_keys = [], []
+        for agent in role_agents:
+            unbound_keys.append(get_key(_get_unbound_agent(agent)))
+            bound_keys.append(
+                get_key(agent.bound_conditions[0].agent)
+                if agent.bound_conditions else np.nan)
+        wide[role] = unbound_keys
+        wide[f'{role}_bound'] = bound_keys
+    # Cross join the unbound and bound variants of A, B and C within each
+    # row, dropping variants for agents without bound conditions
+    expanded = None
+    for role in ('A', 'B', 'C'):
+        variants = wide.melt(id_vars='row', value_vars=[role, f'{role}_bound'],
+                             var_name=f'{role}_variant',
+                             value_name=f'{role}_key').dropna()
+        expanded = variants if expanded is None else \
+            expanded.merge(variants, on='row')
+    # Same order as itertools.product over (agent, bound agent) for each
+    expanded = expanded.sort_values(['row', 'A_variant', 'B_variant',
+                                     'C_variant'], kind='stable')
+    result = df.iloc[expanded.row.to_numpy()].reset_index(drop=True)
+    result = result.rename({'statement1': 'signor_statement1',
+                            'statement2': 'signor_statement2'}, axis=1)
+    for role in ('A', 'B', 'C'):
+        result[role] = [agents[key] for key
+                        in expanded[f'{role}_key'].astype(int)]
+    return result
+
+
+def iter_expanded_statements(df):
+    """Build the statements A -> B and B -> C for each expanded triple
+
+    Statements are shallow copies of the SIGNOR statements with their
+    agents replaced, built one row at a time as they are consumed.
+    Evidence is shared with the SIGNOR statements.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        DataFrame as returned by expand_bound_conditions.
+
+    Returns
+    -------
+    generator of tuple
+        Yields tuples of the form (statement1, statement2).
+    """
+    for statement1, statement2, A, B, C in zip(df.signor_statement1,
+                                               df.signor_statement2,
+                                               df.A, df.B, df.C):
+        new_stmt1 = copy(statement1)
+        new_stmt2 = copy(statement2)
+        new_stmt1.subj, new_stmt1.obj = A, B
+        new_stmt2.subj, new_stmt2.obj = B, C
+        yield new_stmt1, new_stmt2
 
 
 def _get_unbound_agent(agent):
-    """Return agent with all bound conditoins removed"""
-    result = deepcopy(agent)
-    if result.bound_conditions:
-        result.bound_conditions = []
+    """Return agent with all bound conditions removed"""
+    if not agent.bound_conditions:
+        return agent
+    result = copy(agent)
+    result.bound_conditions = []
     return result
 
 
-def main():
+@click.command()
+@click.option('--all-pathways', is_flag=True,
+              help='List every pathway each triple appears in rather than'
+                   ' only the first.')
+def main(all_pathways):
     triples_df = generate_signor_triples_dataframe(
-        get_relevant_signor_statements()
+        get_relevant_signor_statements(), all_pathways=all_pathways
     )
     print('Writing result to file.')
-    triples_df.to_pickle(os.path.join(locations.TRIPLES_DIRECTORY,
-                                      'signor_causal_triples.pkl'))
+    write_triples(get_triples_table(triples_df,
+                                    iter_expanded_statements(triples_df)),
+                  os.path.join(locations.TRIPLES_DIRECTORY,
+                               'signor_causal_triples.parquet'))
 
 if __name__ == '__main__':
     main()
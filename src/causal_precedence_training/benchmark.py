@@ -0,0 +1,278 @@
+"""Benchmark the triple to dataset pipeline on a synthetic local snapshot.
+
+Run with ``python -m causal_precedence_training.benchmark``. Results are
+written as json so that runs from different commits can be compared.
+"""
+
+import gzip
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import click
+from indra_db.util.helpers import unpack
+from sqlalchemy import event
+
+from . import query_indra_db
+from .reach_output import get_neighboring_sentence_pairs, \
+    get_reach_causality_dataframe_for_triples, \
+    match_up_texts_to_sentence_rows
+from .revision import get_commit
+from .sentence_index import ReadingSentenceIndex, SENTENCE_INDEX_CACHE
+from .snapshot import create_snapshot, use_local_snapshot, \
+    write_snapshot_rows
+
+
+@click.command()
+@click.option('--pairs', 'n_pairs', default=200, show_default=True,
+              help='Number of consecutive A->B pairs in the fixture.')
+@click.option('--readings-per-pair', default=5, show_default=True,
+              help='Number of readings shared by each pair and the next.')
+@click.option('--extractions-per-reading', default=20, show_default=True,
+              help='Number of extractions of each pair in a reading.')
+@click.option('--repeats', default=3, show_default=True,
+              help='Number of times to time each stage. The best is kept.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--output', default=None,
+              help='Path to write json results to. Printed if not given.')
+def main(n_pairs, readings_per_pair, extractions_per_reading, repeats, seed,
+         output):
+    """Benchmark each stage of the pipeline and write json results."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'snapshot.sqlite')
+        triples = create_synthetic_snapshot(
+            path, n_pairs=n_pairs, readings_per_pair=readings_per_pair,
+            extractions_per_reading=extractions_per_reading, seed=seed)
+        results = run_benchmark(path, triples, repeats=repeats)
+    results['parameters'] = {
+        'pairs': n_pairs,
+        'readings_per_pair': readings_per_pair,
+        'extractions_per_reading': extractions_per_reading,
+        'repeats': repeats,
+        'seed': seed,
+    }
+    results_json = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(results_json)
+    else:
+        click.echo(results_json)
+
+
+def create_synthetic_snapshot(path, n_pairs=200, readings_per_pair=5,
+                              extractions_per_reading=20, seed=0):
+    """Write a synthetic local snapshot for benchmarks
+
+    Agents HGNC:0 to HGNC:{n_pairs} form a chain of pairs HGNC:i ->
+    HGNC:i+1, each supported by a single preassembled statement. Each
+    pair is extracted together with the next pair in readings_per_pair
+    readings, extractions_per_reading times each, at random sentences.
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file to write.
+    n_pairs : Optional[int]
+        Number of pairs in the chain. Default: 200
+    readings_per_pair : Optional[int]
+        Number of readings shared by each pair and the next. Default: 5
+    extractions_per_reading : Optional[int]
+        Number of extractions of each pair in a reading. Default: 20
+    seed : Optional[int]
+        Seed for the random placement of extractions. Default: 0
+
+    Returns
+    -------
+    list of tuple
+        The triples (HGNC:i, HGNC:i+1, HGNC:i+2) that have support in the
+        snapshot.
+    """
+    rng = random.Random(seed)
+    connection = create_snapshot(path)
+    write_snapshot_rows(
+        connection, 'pa_agents',
+        (row for i in range(n_pairs)
+         for row in ((i, 'HGNC', str(i), 'SUBJECT'),
+                     (i, 'HGNC', str(i + 1), 'OBJECT'))))
+    write_snapshot_rows(
+        connection, 'pa_statements',
+        ((i, rng.choice(['Activation', 'Inhibition']))
+         for i in range(n_pairs)))
+    n_sentences = 2 * extractions_per_reading
+    raw_stmt_id = 0
+    for pair_index in range(n_pairs):
+        links, raw_stmts, readings = [], [], []
+        for k in range(readings_per_pair):
+            reading_id = pair_index * readings_per_pair + k
+            sentences, events = [], []
+            offset = 0
+            for sentence_index in range(n_sentences):
+                length = rng.randint(50, 250)
+                sentences.append(
+                    {'frame-id': f'sent-{reading_id}-{sentence_index}',
+                     'start-pos': {'offset': offset},
+                     'end-pos': {'offset': offset + length},
+                     'text': 'x' * length})
+                offset += length + 1
+            # Extractions of this pair and the next in the same reading
+            for mk_hash in (pair_index, pair_index + 1):
+                if mk_hash >= n_pairs:
+                    continue
+                for _ in range(extractions_per_reading):
+                    sentence = rng.choice(sentences)
+                    text = f'HGNC:{mk_hash} affects HGNC:{mk_hash + 1}' \
+                        f' ({raw_stmt_id})'
+                    events.append({'verbose-text': text,
+                                   'sentence': sentence['frame-id']})
+                    stmt_json = {'evidence': [{'text': text}]}
+                    links.append((mk_hash, raw_stmt_id))
+                    raw_stmts.append((raw_stmt_id, reading_id,
+                                      json.dumps(stmt_json).encode('utf-8')))
+                    raw_stmt_id += 1
+            reach_json = {'events': {'frames': events},
+                          'sentences': {'frames': sentences}}
+            readings.append((reading_id, 'REACH', gzip.compress(
+                json.dumps(reach_json).encode('utf-8'))))
+        write_snapshot_rows(connection, 'raw_unique_links', links)
+        write_snapshot_rows(connection, 'raw_statements', raw_stmts)
+        write_snapshot_rows(connection, 'reading', readings)
+    connection.close()
+    return [(f'HGNC:{i}', f'HGNC:{i + 1}', f'HGNC:{i + 2}')
+            for i in range(n_pairs - 1)]
+
+
+class QueryCounter:
+    """Count queries executed on a sqlalchemy engine"""
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+
+@contextmanager
+def _timed(results, name, counter):
+    start_count = counter.count
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    if name not in results or seconds < results[name]['seconds']:
+        results[name] = {'seconds': seconds,
+                         'queries': counter.count - start_count}
+
+
+def run_benchmark(path, triples, repeats=3):
+    """Time each stage of the pipeline against a local snapshot
+
+    Parameters
+    ----------
+    path : str
+        Path to a local snapshot.
+    triples : list of tuple
+        Triples to generate datasets for.
+    repeats : Optional[int]
+        Number of times to run each stage. The fastest run is reported.
+        Default: 3
+
+    Returns
+    -------
+    dict
+        Timings and query counts for each stage, end to end throughput in
+        triples per second, and peak resident set size.
+    """
+    use_local_snapshot(path)
+    previous_cache = query_indra_db.get_cache()
+    query_indra_db.set_cache(None)
+    counter = QueryCounter(query_indra_db.get_engine())
+    stages = {}
+    try:
+        for _ in range(repeats):
+            _run_stages(triples, stages, counter)
+        end_to_end = None
+        for _ in range(repeats):
+            SENTENCE_INDEX_CACHE.clear()
+            start_count = counter.count
+            start = time.perf_counter()
+            df = get_reach_causality_dataframe_for_triples(triples,
+                                                           concat=True)
+            seconds = time.perf_counter() - start
+            if end_to_end is None or seconds < end_to_end['seconds']:
+                end_to_end = {'seconds': seconds,
+                              'queries': counter.count - start_count,
+                              'rows': len(df),
+                              'triples_per_second': len(triples) / seconds}
+    finally:
+        query_indra_db.set_cache(previous_cache)
+        query_indra_db.set_backend(None)
+    return {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'triples': len(triples),
+        'stages': stages,
+        'end_to_end': end_to_end,
+        'peak_rss_mb': _get_peak_rss_mb(),
+    }
+
+
+def _run_stages(triples, stages, counter):
+    pairs = {pair for curie1, curie2, curie3 in triples
+             for pair in ((curie1, curie2), (curie2, curie3))}
+    with _timed(stages, 'pair_lookup', counter):
+        mk_hash_dicts = query_indra_db.get_pa_statements_for_pairs(pairs)
+    stmt_mk_hashes = {stmt_mk_hash for mk_hash_dict in mk_hash_dicts.values()
+                      for stmt_mk_hash in mk_hash_dict}
+    with _timed(stages, 'reach_support', counter):
+        support = list(query_indra_db.get_reach_support_for_pa_statements(
+            stmt_mk_hashes))
+    reading_ids = {reading_id for _, _, reading_id in support}
+    with _timed(stages, 'reading_fetch', counter):
+        compressed = query_indra_db.get_compressed_readings_for_reading_ids(
+            reading_ids)
+    with _timed(stages, 'reading_decode', counter):
+        indices = {reading_id: ReadingSentenceIndex.from_reach_json(
+                       json.loads(unpack(bytes_)))
+                   for reading_id, bytes_ in compressed.items()}
+    with _timed(stages, 'evidence_text_fetch', counter):
+        texts = query_indra_db.get_raw_statement_jsons(
+            [raw_stmt_id for _, raw_stmt_id, _ in support],
+            evidence_text_only=True)
+    by_reading_and_hash = {}
+    for stmt_mk_hash, raw_stmt_id, reading_id in support:
+        by_reading_and_hash.setdefault((reading_id, stmt_mk_hash),
+                                       {})[raw_stmt_id] = texts[raw_stmt_id]
+    matched = {}
+    with _timed(stages, 'sentence_matching', counter):
+        for (reading_id, stmt_mk_hash), stmt_texts in \
+                by_reading_and_hash.items():
+            matched[reading_id, stmt_mk_hash] = \
+                match_up_texts_to_sentence_rows(stmt_texts,
+                                                indices[reading_id])
+    with _timed(stages, 'pairing', counter):
+        for (reading_id, stmt_mk_hash), rows1 in matched.items():
+            rows2 = matched.get((reading_id, stmt_mk_hash + 1))
+            if not rows2:
+                continue
+            index = indices[reading_id]
+            rows1, rows2 = list(rows1.values()), list(rows2.values())
+            get_neighboring_sentence_pairs(index.start_positions[rows1],
+                                           index.end_positions[rows1],
+                                           index.start_positions[rows2])
+
+
+def _get_peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return peak / 2 ** 20
+    return peak / 2 ** 10
+
+
+if __name__ == '__main__':
+    main()
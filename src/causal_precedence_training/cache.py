@@ -0,0 +1,229 @@
+"""Persistent on-disk cache for indra_db lookups."""
+
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from . import locations
+
+#: Default location of the cache file
+DEFAULT_CACHE_PATH = os.path.join(locations.LOCAL_DATA_HOME,
+                                  'indra_db_cache.sqlite')
+#: Location of the cache file for results from local snapshots of indra_db
+LOCAL_SNAPSHOT_CACHE_PATH = os.path.join(locations.LOCAL_DATA_HOME,
+                                         'local_snapshot_cache.sqlite')
+#: Default maximum total size in bytes of cached values
+DEFAULT_MAX_SIZE = 10 * 2 ** 30
+
+# SQLite limits the number of bind parameters in a single statement
+_SQLITE_BATCH_SIZE = 500
+
+
+def _cache_key(key):
+    # Tuples are stored as json lists. numpy integers become plain ints.
+    return json.dumps(key, default=int)
+
+
+class QueryCache:
+    """Size bounded, least recently used cache of query results in SQLite
+
+    Entries are keyed by the kind of query and the argument it was run
+    for, such as a pair of curies or a reading id. The cache is tied to
+    the database queried and to its snapshot version. Opening it for a
+    different database or snapshot version clears it, so results from
+    an older database, or from a local snapshot in place of the live
+    one, are never reused.
+
+    Parameters
+    ----------
+    path : Optional[str]
+        Path to the SQLite file. Default: DEFAULT_CACHE_PATH
+    max_size : Optional[int]
+        Maximum total size in bytes of cached values. Least recently used
+        entries are evicted when it is exceeded. Default: DEFAULT_MAX_SIZE
+    snapshot : Optional[str]
+        Version of the database snapshot cached results come from. If
+        None, the cache is used regardless of the version it was filled
+        from.
+    backend : Optional[str]
+        url of the database queried instead of indra_db, as set with
+        query_indra_db.set_backend, or None for indra_db itself.
+        Default: None
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size=DEFAULT_MAX_SIZE,
+                 snapshot=None, backend=None):
+        self.path = path
+        self.max_size = max_size
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries'
+                ' (kind TEXT NOT NULL, key TEXT NOT NULL, value BLOB,'
+                ' size INTEGER NOT NULL, last_access REAL NOT NULL,'
+                ' PRIMARY KEY (kind, key))')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_last_access'
+                ' ON entries (last_access)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS meta'
+                ' (name TEXT PRIMARY KEY, value TEXT)')
+        if backend != self._get_meta('backend') or \
+                snapshot is not None and snapshot != self.get_snapshot():
+            self.invalidate(snapshot, backend)
+        self._total_size = self._get_total_size()
+
+    def _get_total_size(self):
+        total, = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return total
+
+    def get_snapshot(self):
+        """Return the snapshot version cached results come from"""
+        return self._get_meta('snapshot')
+
+    def _get_meta(self, name):
+        row = self.connection.execute(
+            'SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, snapshot=None, backend=None):
+        """Remove all entries and record a new snapshot version and backend"""
+        with self._lock, self.connection:
+            self.connection.execute('DELETE FROM entries')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                [('snapshot', snapshot), ('backend', backend)])
+            self._total_size = 0
+
+    def get_many(self, kind, keys):
+        """Return dict of cached values for those keys present in the cache
+
+        Parameters
+        ----------
+        kind : str
+            The kind of query, e.g. 'reading'.
+        keys : iterable
+            Arguments the query was run for.
+
+        Returns
+        -------
+        dict
+            dict mapping keys found in the cache to their values.
+        """
+        results = {}
+        for batch in self.iter_many(kind, keys):
+            results.update(batch)
+        return results
+
+    def iter_many(self, kind, keys, batch_size=_SQLITE_BATCH_SIZE):
+        """Stream cached values for those keys present in the cache
+
+        Values are read batch_size keys at a time, and each batch is
+        yielded before the next is read, so only one batch of values is
+        held in memory at once.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of query, e.g. 'reading'.
+        keys : iterable
+            Arguments the query was run for.
+        batch_size : Optional[int]
+            Number of keys looked up at a time. No more than
+            _SQLITE_BATCH_SIZE. Default: _SQLITE_BATCH_SIZE
+
+        Returns
+        -------
+        generator of dict
+            Yields a dict mapping the keys of each batch found in the
+            cache to their values.
+        """
+        keys = list(keys)
+        batch_size = min(batch_size, _SQLITE_BATCH_SIZE)
+        for start in range(0, len(keys), batch_size):
+            batch = {_cache_key(key): key
+                     for key in keys[start:start + batch_size]}
+            placeholders = ', '.join('?' * len(batch))
+            with self._lock, self.connection:
+                rows = self.connection.execute(
+                    f'SELECT key, value FROM entries WHERE kind = ?'
+                    f' AND key IN ({placeholders})',
+                    (kind, *batch)).fetchall()
+                self.connection.executemany(
+                    'UPDATE entries SET last_access = ?'
+                    ' WHERE kind = ? AND key = ?',
+                    ((time.time(), kind, cache_key)
+                     for cache_key, _ in rows))
+            results = {batch[cache_key]: pickle.loads(value)
+                       for cache_key, value in rows}
+            self.hits[kind] += len(results)
+            self.misses[kind] += len(batch) - len(results)
+            yield results
+
+    def put_many(self, kind, items):
+        """Add values to the cache, evicting old entries if needed
+
+        Parameters
+        ----------
+        kind : str
+            The kind of query, e.g. 'reading'.
+        items : dict
+            dict mapping query arguments to results.
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((kind, _cache_key(key), value, len(value), now))
+        with self._lock, self.connection:
+            # Sizes of the entries being replaced are read in the same
+            # transaction so the running total never has to be recounted
+            replaced = 0
+            for start in range(0, len(rows), _SQLITE_BATCH_SIZE):
+                batch = [cache_key for _, cache_key, _, _, _
+                         in rows[start:start + _SQLITE_BATCH_SIZE]]
+                placeholders = ', '.join('?' * len(batch))
+                size, = self.connection.execute(
+                    f'SELECT COALESCE(SUM(size), 0) FROM entries'
+                    f' WHERE kind = ? AND key IN ({placeholders})',
+                    (kind, *batch)).fetchone()
+                replaced += size
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                rows)
+            self._total_size += sum(row[3] for row in rows) - replaced
+            if self._total_size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # Remove least recently used entries until the cache is no more
+        # than 90% full so that eviction doesn't happen on every put.
+        target = 0.9 * self.max_size
+        freed = 0
+        to_delete = []
+        for kind, key, size in self.connection.execute(
+                'SELECT kind, key, size FROM entries ORDER BY last_access'):
+            if self._total_size - freed <= target:
+                break
+            to_delete.append((kind, key))
+            freed += size
+        self.connection.executemany(
+            'DELETE FROM entries WHERE kind = ? AND key = ?', to_delete)
+        self._total_size -= freed
+
+    def get_stats(self):
+        """Return dict with hit and miss counts for each kind of query"""
+        return {kind: {'hits': self.hits[kind], 'misses': self.misses[kind]}
+                for kind in sorted(self.hits.keys() | self.misses.keys())}
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,264 @@
+"""Discovery of causal chains co-extracted within single REACH readings.
+
+Rather than starting from curated triples and querying support for each
+of their pairs, REACH raw statements are streamed grouped by reading and
+every chain A -> B -> C whose links were both extracted from the same
+reading is found in one pass. Support for a chain has the same meaning
+as in reach_output.get_reach_support_for_triple. Run with
+``python -m causal_precedence_training.chains``.
+"""
+
+import time
+from collections import defaultdict
+from itertools import groupby, islice
+from operator import itemgetter
+
+import click
+import pandas as pd
+
+from .metrics import METRICS
+from .query_indra_db import CHUNK_SIZE, get_raw_statement_jsons, \
+    iter_reach_reading_id_batches, iter_reach_statement_agents_by_reading
+from .reach_output import DATAFRAME_COLUMNS, _get_rows_for_reading, \
+    get_sentence_indices_for_reading_ids
+from .snapshot import use_local_snapshot
+
+
+@click.command()
+@click.argument('output_path')
+@click.option('--triples', 'triples_path', default=None,
+              help='Only keep chains for triples in a csv with columns'
+                   ' agent1, agent2 and agent3 holding curies.')
+@click.option('--namespaces', default=None,
+              help='Comma separated namespaces in order of priority. Each'
+                   ' agent is then only grounded to the first of them it'
+                   ' has.')
+@click.option('--neighbor-cutoff', default=20, show_default=True)
+@click.option('--sentence-window', default=None, type=int)
+@click.option('--local-snapshot', default=None,
+              help='Path to a local snapshot of indra_db to query instead'
+                   ' of the live database.')
+def main(output_path, triples_path, namespaces, neighbor_cutoff,
+         sentence_window, local_snapshot):
+    """Write training examples for chains in all REACH readings to a csv."""
+    if local_snapshot:
+        use_local_snapshot(local_snapshot)
+    triples = None
+    if triples_path:
+        triples_df = pd.read_csv(triples_path, usecols=['agent1', 'agent2',
+                                                         'agent3'])
+        triples = set(triples_df.itertuples(index=False, name=None))
+    if namespaces:
+        namespaces = namespaces.split(',')
+    dfs = iter_reach_causality_dataframes_for_readings(
+        triples=triples, namespaces=namespaces,
+        neighbor_cutoff=neighbor_cutoff, sentence_window=sentence_window)
+    count = 0
+    for df in dfs:
+        df.to_csv(output_path, index=False, mode='w' if count == 0 else 'a',
+                  header=count == 0)
+        count += len(df)
+    if count == 0:
+        pd.DataFrame(columns=DATAFRAME_COLUMNS).to_csv(output_path,
+                                                       index=False)
+    click.echo(f'Wrote {count} rows to {output_path}')
+
+
+def get_chains_for_reading(rows, triples=None, namespaces=None):
+    """Find chains A -> B -> C among the statements of a single reading
+
+    Parameters
+    ----------
+    rows : iterable of tuple
+        Rows for one reading as yielded by
+        query_indra_db.iter_reach_statement_agents_by_reading.
+    triples : Optional[set of tuple]
+        If given, only chains in this set of triples of curies are kept.
+        Default: None
+    namespaces : Optional[list of str]
+        If given, each agent is only grounded to the first of these
+        namespaces that it has a grounding for, and agents grounded to none
+        of them are dropped. Otherwise every grounding is used, as in a
+        lookup by pair. Default: None
+
+    Returns
+    -------
+    dict
+        dict mapping triples (curie1, curie2, curie3) to dicts with
+        entries 'A->B' and 'B->C', each a list of tuples of the form
+        (raw_stmt_id, statement_type). Links from an agent to itself
+        are left out.
+    """
+    # Collect the groundings of the subject and object of each statement
+    stmts = {}
+    for _, raw_stmt_id, stmt_type, role, db_name, db_id in rows:
+        if raw_stmt_id not in stmts:
+            stmts[raw_stmt_id] = (stmt_type, {'SUBJECT': {}, 'OBJECT': {}})
+        stmts[raw_stmt_id][1][role][db_name] = db_id
+    pairs = None
+    if triples is not None:
+        pairs = {pair for curie1, curie2, curie3 in triples
+                 for pair in ((curie1, curie2), (curie2, curie3))}
+    # Maps subjects to dicts mapping objects to supporting statements
+    adjacency = defaultdict(lambda: defaultdict(list))
+    for raw_stmt_id, (stmt_type, groundings) in stmts.items():
+        subjects = _get_curies(groundings['SUBJECT'], namespaces)
+        objects = _get_curies(groundings['OBJECT'], namespaces)
+        for subject in subjects:
+            for object_ in objects:
+                if subject == object_:
+                    continue
+                if pairs is not None and (subject, object_) not in pairs:
+                    continue
+                adjacency[subject][object_].append((raw_stmt_id, stmt_type))
+    chains = {}
+    for curie1, objects in adjacency.items():
+        for curie2, AB_stmts in objects.items():
+            for curie3, BC_stmts in adjacency.get(curie2, {}).items():
+                triple = (curie1, curie2, curie3)
+                if triples is not None and triple not in triples:
+                    continue
+                chains[triple] = {'A->B': AB_stmts, 'B->C': BC_stmts}
+    return chains
+
+
+def _get_curies(groundings, namespaces):
+    if namespaces is None:
+        return [f'{db_name}:{db_id}' for db_name, db_id in groundings.items()]
+    for namespace in namespaces:
+        if namespace in groundings:
+            return [f'{namespace}:{groundings[namespace]}']
+    return []
+
+
+def iter_reading_chains(reading_ids=None, triples=None, namespaces=None,
+                        **kwargs):
+    """Stream chains A -> B -> C found within each REACH reading
+
+    Parameters
+    ----------
+    reading_ids : Optional[iterable of int]
+        reading ids to look in. If None, all REACH readings are scanned.
+        Default: None
+    triples : Optional[iterable of tuple]
+        If given, only chains for these triples of curies are kept. The
+        filter is applied in memory as each reading is scanned.
+        Default: None
+    namespaces : Optional[list of str]
+        See get_chains_for_reading.
+    **kwargs
+        Passed on to iter_chunked_query.
+
+    Returns
+    -------
+    generator of tuple
+        Yields tuples of the form (reading_id, chains) for readings with
+        at least one chain, where chains is as returned by
+        get_chains_for_reading.
+    """
+    if triples is not None:
+        triples = {tuple(triple) for triple in triples}
+    rows = iter_reach_statement_agents_by_reading(reading_ids, **kwargs)
+    return _iter_chains_for_rows(rows, triples, namespaces)
+
+
+def _iter_chains_for_rows(rows, triples, namespaces):
+    for reading_id, reading_rows in groupby(rows, key=itemgetter(0)):
+        start = time.perf_counter()
+        chains = get_chains_for_reading(reading_rows, triples=triples,
+                                        namespaces=namespaces)
+        METRICS.add('chain_discovery', seconds=time.perf_counter() - start,
+                    rows=len(chains))
+        if chains:
+            yield reading_id, chains
+
+
+def iter_reach_causality_dataframes_for_readings(reading_ids=None,
+                                                 triples=None,
+                                                 namespaces=None,
+                                                 neighbor_cutoff=20,
+                                                 sentence_window=None,
+                                                 batch_size=500):
+    """Stream DataFrames of training examples for chains found in readings
+
+    Readings are scanned CHUNK_SIZE at a time. Readings with chains are
+    collected batch_size at a time, then the evidence texts and sentence
+    indices they need are fetched together and rows are built as in
+    reach_output.get_reach_causality_dataframe_for_triples.
+
+    Parameters
+    ----------
+    reading_ids : Optional[iterable of int]
+        reading ids to look in. If None, all REACH readings are scanned.
+        Default: None
+    triples : Optional[iterable of tuple]
+        See iter_reading_chains.
+    namespaces : Optional[list of str]
+        See get_chains_for_reading.
+    neighbor_cutoff : Optional[int]
+        See reach_output.get_reach_causality_dataframe_for_triple.
+    sentence_window : Optional[int]
+        See reach_output.get_reach_causality_dataframe_for_triple.
+    batch_size : Optional[int]
+        Number of readings with chains handled at a time. Default: 500
+
+    Returns
+    -------
+    generator of pandas.DataFrame
+        Yields a DataFrame with columns DATAFRAME_COLUMNS for each batch of
+        readings.
+    """
+    if triples is not None:
+        triples = {tuple(triple) for triple in triples}
+    if reading_ids is None:
+        reading_id_batches = iter_reach_reading_id_batches()
+    else:
+        reading_ids = iter(dict.fromkeys(reading_ids))
+        reading_id_batches = iter(lambda: list(islice(reading_ids,
+                                                      CHUNK_SIZE)), [])
+    batch = []
+    for reading_id_batch in reading_id_batches:
+        # Rows are read in full before more queries are run so that the
+        # scan doesn't hold a session, which could leave none for them
+        rows = list(iter_reach_statement_agents_by_reading(reading_id_batch))
+        for reading_id, chains in _iter_chains_for_rows(rows, triples,
+                                                        namespaces):
+            batch.append((reading_id, chains))
+            if len(batch) >= batch_size:
+                yield _get_dataframe_for_readings(batch, neighbor_cutoff,
+                                                  sentence_window)
+                batch = []
+    if batch:
+        yield _get_dataframe_for_readings(batch, neighbor_cutoff,
+                                          sentence_window)
+
+
+def _get_dataframe_for_readings(batch, neighbor_cutoff, sentence_window):
+    raw_stmt_ids = {raw_stmt_id for _, chains in batch
+                    for stmts in chains.values()
+                    for link in ('A->B', 'B->C')
+                    for raw_stmt_id, _ in stmts[link]}
+    # Each reading is only visited once, so its index isn't worth caching
+    with METRICS.timer('readings', readings=len(batch)) as record:
+        sentence_indices = get_sentence_indices_for_reading_ids(
+            (reading_id for reading_id, _ in batch), cache=None)
+        record['rows'] = len(sentence_indices)
+    with METRICS.timer('evidence_texts', stmts=len(raw_stmt_ids)) as record:
+        stmt_texts = get_raw_statement_jsons(raw_stmt_ids,
+                                             evidence_text_only=True)
+        record['rows'] = len(stmt_texts)
+    start = time.perf_counter()
+    rows = []
+    for reading_id, chains in batch:
+        for triple, stmts in chains.items():
+            rows.extend(_get_rows_for_reading(triple, reading_id, stmts,
+                                              sentence_indices[reading_id],
+                                              stmt_texts, neighbor_cutoff,
+                                              sentence_window))
+    METRICS.add('pairing', seconds=time.perf_counter() - start,
+                rows=len(rows))
+    return pd.DataFrame(rows, columns=DATAFRAME_COLUMNS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Single file store for resumable per-triple dataset generation."""
+
+import sqlite3
+
+import pandas as pd
+
+FOUND = 'found'
+NONE = 'none'
+UNGROUNDED = 'ungrounded'
+
+
+class CheckpointStore:
+    """Append only SQLite store of results for each triple
+
+    The completion status of each triple and the rows of results found for
+    it are written in the same transaction, so a run that is interrupted
+    can be resumed from exactly the triples that have been recorded.
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file. Created if it doesn't exist.
+    columns : list of str
+        Names of the columns of result rows.
+    """
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = list(columns)
+        self.connection = sqlite3.connect(path)
+        column_defs = ', '.join(f'"{column}"' for column in self.columns)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS status'
+                ' (triple_index INTEGER PRIMARY KEY, status TEXT NOT NULL)')
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS results'
+                f' (triple_index INTEGER NOT NULL, {column_defs})')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS results_triple_index'
+                ' ON results (triple_index)')
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_completed(self):
+        """Return dict mapping recorded triple indices to their status"""
+        return dict(self.connection.execute(
+            'SELECT triple_index, status FROM status'))
+
+    def record(self, triple_index, status, df=None):
+        """Record status and result rows for a triple in one transaction
+
+        Parameters
+        ----------
+        triple_index : int
+            Index of the triple in the input.
+        status : str
+            One of FOUND, NONE or UNGROUNDED.
+        df : Optional[pandas.DataFrame]
+            Result rows for the triple. Must contain all of the store's
+            columns.
+        """
+        placeholders = ', '.join('?' * (len(self.columns) + 1))
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO status VALUES (?, ?)',
+                (int(triple_index), status))
+            # Drop partial results left by an earlier record of this triple
+            self.connection.execute(
+                'DELETE FROM results WHERE triple_index = ?',
+                (int(triple_index),))
+            if df is not None and len(df):
+                self.connection.executemany(
+                    f'INSERT INTO results VALUES ({placeholders})',
+                    ((int(triple_index), *row) for row in
+                     df[self.columns].itertuples(index=False, name=None)))
+
+    def get_distinct_values(self, column):
+        """Return set of the distinct values of a column of results"""
+        return {value for value, in self.connection.execute(
+            f'SELECT DISTINCT "{column}" FROM results')}
+
+    def iter_results(self, chunksize=10000):
+        """Stream result rows in the input order of their triples
+
+        Rows are ordered by the index of their triple in the input,
+        whatever order triples finished in, and then by the order they
+        were recorded in.
+
+        Parameters
+        ----------
+        chunksize : Optional[int]
+            Number of rows in each yielded DataFrame. Default: 10000
+
+        Returns
+        -------
+        generator of pandas.DataFrame
+        """
+        column_names = ', '.join(f'"{column}"' for column in self.columns)
+        query = (f'SELECT {column_names} FROM results'
+                 f' ORDER BY triple_index, rowid')
+        yield from pd.read_sql_query(query, self.connection,
+                                     chunksize=chunksize)
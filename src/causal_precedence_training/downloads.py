@@ -1,26 +1,287 @@
-"""Functions for downloading datafiles."""
+"""Functions for downloading datafiles.
 
+Objects are only downloaded when their ETag differs from the one recorded
+in a local manifest the last time they were downloaded. Large objects are
+fetched with parallel ranged GETs, and tarballs are extracted as they are
+streamed rather than being saved to disk first. The S3 endpoint can be
+set with the s3_endpoint_url option in pystow's causal_precedence_training
+config, e.g. through the environment variable
+CAUSAL_PRECEDENCE_TRAINING_S3_ENDPOINT_URL, to use a local S3 stand-in.
+"""
+
+import io
+import json
 import os
 import shutil
 import tarfile
-
+import tempfile
 import boto3
+import pystow
+
 from causal_precedence_training import locations
+from causal_precedence_training.parallel import imap_ordered
+
+#: Path to the manifest of ETags of downloaded objects
+MANIFEST_PATH = os.path.join(locations.LOCAL_DATA_HOME,
+                             'downloads_manifest.json')
+#: Objects larger than this many bytes are fetched with parallel ranged GETs
+MULTIPART_THRESHOLD = 64 * 2 ** 20
+#: Size in bytes of each ranged GET
+PART_SIZE = 16 * 2 ** 20
+#: Number of ranged GETs in flight at once
+MAX_CONCURRENCY = 8
+
+
+def get_s3_client(endpoint_url=None):
+    """Return an S3 client
+
+    Parameters
+    ----------
+    endpoint_url : Optional[str]
+        URL of the S3 endpoint. Default: the s3_endpoint_url pystow config
+        option for causal_precedence_training, or AWS if it isn't set.
+    """
+    if endpoint_url is None:
+        endpoint_url = pystow.get_config('causal_precedence_training',
+                                         's3_endpoint_url')
+    return boto3.client('s3', endpoint_url=endpoint_url)
+
+
+def download_signor_pathways(force=False, client=None):
+    """Download SIGNOR pathways into data directory.
+
+    Parameters
+    ----------
+    force : Optional[bool]
+        If True, download even if the local copy is up to date.
+        Default: False
+    client : Optional[botocore.client.S3]
+        S3 client to use. Default: get_s3_client()
+
+    Returns
+    -------
+    bool
+        True if the pathways were downloaded, False if the local copy was
+        already up to date.
+    """
+    # The tarball holds a SIGNOR_pathways folder, which is moved to the
+    # location listed in causal_precedence_training.locations
+    key = f'{locations.S3_DATA_PATH}/SIGNOR_pathways.tar.gz'
+    return download_tarball(key, locations.SIGNOR_PATHWAYS_DIRECTORY,
+                            member_root='SIGNOR_pathways', force=force,
+                            client=client)
+
+
+def download_file(key, path, bucket=locations.S3_BUCKET, force=False,
+                  client=None):
+    """Download an object from S3 to a file unless it is up to date
+
+    Parameters
+    ----------
+    key : str
+        Key of the object in the bucket.
+    path : str
+        Path of the file to write. It is replaced atomically once the
+        download has finished.
+    bucket : Optional[str]
+        Name of the bucket. Default: locations.S3_BUCKET
+    force : Optional[bool]
+        If True, download even if the local copy is up to date.
+        Default: False
+    client : Optional[botocore.client.S3]
+        S3 client to use. Default: get_s3_client()
+
+    Returns
+    -------
+    bool
+        True if the object was downloaded, False if the local copy was
+        already up to date.
+    """
+    client = client or get_s3_client()
+    etag, size = _head_object(client, bucket, key)
+    if not force and _is_up_to_date(bucket, key, etag, path):
+        return False
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+        try:
+            with open_object(client, bucket, key, etag, size) as stream:
+                shutil.copyfileobj(stream, f, PART_SIZE)
+        except BaseException:
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+    _record_download(bucket, key, etag, path)
+    return True
+
+
+def download_tarball(key, directory, member_root=None,
+                     bucket=locations.S3_BUCKET, force=False, client=None):
+    """Download and extract a tar.gz object from S3 unless it is up to date
+
+    The tarball is extracted as it is streamed from S3 into a temporary
+    directory next to the target, which then replaces the target, so a
+    failed download never leaves a partially extracted directory behind.
+
+    Parameters
+    ----------
+    key : str
+        Key of the object in the bucket.
+    directory : str
+        Directory to extract into.
+    member_root : Optional[str]
+        If given, the folder within the tarball whose contents are placed
+        in directory. Default: None
+    bucket : Optional[str]
+        Name of the bucket. Default: locations.S3_BUCKET
+    force : Optional[bool]
+        If True, download even if the local copy is up to date.
+        Default: False
+    client : Optional[botocore.client.S3]
+        S3 client to use. Default: get_s3_client()
+
+    Returns
+    -------
+    bool
+        True if the tarball was downloaded, False if the local copy was
+        already up to date.
+
+    Raises
+    ------
+    ValueError
+        If member_root is given but isn't a folder in the tarball. The
+        local copy is left as it was.
+    """
+    client = client or get_s3_client()
+    etag, size = _head_object(client, bucket, key)
+    if not force and _is_up_to_date(bucket, key, etag, directory):
+        return False
+    directory = os.path.abspath(directory)
+    temp_directory = tempfile.mkdtemp(dir=os.path.dirname(directory))
+    try:
+        with open_object(client, bucket, key, etag, size) as stream, \
+                tarfile.open(fileobj=stream, mode='r|gz') as tar:
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(path=temp_directory, filter='data')
+            else:
+                tar.extractall(path=temp_directory)
+        extracted = os.path.join(temp_directory, member_root) \
+            if member_root else temp_directory
+        # Checked before the local copy is removed so that it is kept
+        if not os.path.isdir(extracted):
+            raise ValueError(f'{key} has no folder {member_root}')
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(extracted, directory)
+    finally:
+        if os.path.exists(temp_directory):
+            shutil.rmtree(temp_directory)
+    _record_download(bucket, key, etag, directory)
+    return True
+
+
+def open_object(client, bucket, key, etag, size):
+    """Open a readable stream of the body of an S3 object
+
+    Objects larger than MULTIPART_THRESHOLD are fetched PART_SIZE bytes at
+    a time with up to MAX_CONCURRENCY ranged GETs in flight, and parts are
+    returned in order. Every GET is conditional on the ETag, so a change
+    to the object during the download raises an error rather than mixing
+    versions.
+
+    Parameters
+    ----------
+    client : botocore.client.S3
+        S3 client to use.
+    bucket : str
+        Name of the bucket.
+    key : str
+        Key of the object in the bucket.
+    etag : str
+        ETag of the object, as returned by head_object.
+    size : int
+        Size of the object in bytes.
+
+    Returns
+    -------
+    io.BufferedIOBase
+    """
+    if size <= MULTIPART_THRESHOLD:
+        body = client.get_object(Bucket=bucket, Key=key,
+                                 IfMatch=etag)['Body']
+        return io.BufferedReader(_PartsStream(iter(lambda: body.read(
+            PART_SIZE), b''), close=body.close), buffer_size=PART_SIZE)
+
+    def get_part(start):
+        end = min(start + PART_SIZE, size) - 1
+        response = client.get_object(Bucket=bucket, Key=key, IfMatch=etag,
+                                     Range=f'bytes={start}-{end}')
+        return response['Body'].read()
+
+    parts = imap_ordered(get_part, range(0, size, PART_SIZE),
+                         n_workers=MAX_CONCURRENCY,
+                         max_pending=MAX_CONCURRENCY)
+    return io.BufferedReader(_PartsStream((part for _, part in parts),
+                                          close=parts.close),
+                             buffer_size=PART_SIZE)
+
+
+class _PartsStream(io.RawIOBase):
+    """Raw stream reading from an iterator of byte strings"""
+    def __init__(self, parts, close=None):
+        self._parts = parts
+        self._part = memoryview(b'')
+        self._close = close
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._part:
+            part = next(self._parts, None)
+            if part is None:
+                return 0
+            self._part = memoryview(part)
+        n = min(len(buffer), len(self._part))
+        buffer[:n] = self._part[:n]
+        self._part = self._part[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            close = getattr(self._parts, 'close', None)
+            if close is not None:
+                close()
+            if self._close is not None:
+                self._close()
+        super().close()
+
+
+def _head_object(client, bucket, key):
+    response = client.head_object(Bucket=bucket, Key=key)
+    return response['ETag'], response['ContentLength']
+
+
+def _load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _is_up_to_date(bucket, key, etag, path):
+    entry = _load_manifest().get(f'{bucket}/{key}')
+    return entry is not None and entry['etag'] == etag and \
+        entry['path'] == os.path.abspath(path) and os.path.exists(path)
 
 
-def download_signor_pathways():
-    """Download SIGNOR pathways into data directory."""
-    client = boto3.client('s3')
-    pathways_tarball_location = os.path.join(locations.LOCAL_DATA_HOME,
-                                             'SIGNOR_pathways.tar.gz')
-    client.download_file(locations.S3_BUCKET,
-                         f'{locations.S3_DATA_PATH}/SIGNOR_pathways.tar.gz',
-                         pathways_tarball_location)
-    with tarfile.open(pathways_tarball_location) as tar:
-        tar.extractall(path=locations.LOCAL_DATA_HOME)
-    os.remove(pathways_tarball_location)
-    # Change folder name to that listed in
-    # causal_precedence_training.locations (defensive programming)
-    shutil.move(os.path.join(locations.LOCAL_DATA_HOME,
-                             'SIGNOR_pathways'),
-                locations.SIGNOR_PATHWAYS_DIRECTORY)
+def _record_download(bucket, key, etag, path):
+    manifest = _load_manifest()
+    manifest[f'{bucket}/{key}'] = {'etag': etag,
+                                   'path': os.path.abspath(path)}
+    # Write to a temporary file first so the manifest is never left
+    # partially written
+    temp_path = f'{MANIFEST_PATH}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(temp_path, MANIFEST_PATH)
@@ -0,0 +1,47 @@
+"""Export REACH reading outputs referenced by generated datasets."""
+
+import io
+import tarfile
+
+from indra_db.util.helpers import unpack
+
+from .query_indra_db import iter_compressed_readings_for_reading_ids
+
+
+def export_reach_outputs(reading_ids, path, chunk_size=500):
+    """Write REACH output jsons for readings into a tar.gz archive
+
+    Readings are streamed from the database chunk_size at a time and each
+    is written into the archive as soon as it has been decompressed, so
+    peak memory use is roughly that of one chunk regardless of how many
+    readings are exported. The QueryCache is bypassed, since each reading
+    is only exported once.
+
+    Parameters
+    ----------
+    reading_ids : iterable of int
+        reading ids for rows in readings table
+    path : str
+        Path of the tar.gz archive to write. Members are named
+        f'{reading_id}.json'.
+    chunk_size : Optional[int]
+        Number of readings to fetch from the database at a time.
+        Default: 500
+
+    Returns
+    -------
+    int
+        The number of readings written.
+    """
+    count = 0
+    with tarfile.open(path, 'w:gz') as tar:
+        readings = iter_compressed_readings_for_reading_ids(
+            sorted(set(reading_ids)), use_cache=False,
+            chunk_size=chunk_size, yield_per=chunk_size)
+        for reading_id, bytes_ in readings:
+            content = unpack(bytes_).encode('utf-8')
+            info = tarfile.TarInfo(name=f'{reading_id}.json')
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+            count += 1
+    return count
@@ -0,0 +1,137 @@
+"""Lightweight instrumentation for dataset generation runs.
+
+Each stage of the pipeline adds its wall time, row count and bytes
+transferred to the shared METRICS object. If an output file has been set
+with Metrics.set_output, stage timings for each batch and totals for each
+triple are also written to it as json lines, followed by a summary at the
+end of the run.
+"""
+
+import cProfile
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Thread safe accumulator of per stage metrics"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._output = None
+        self.start_time = time.time()
+        self.stages = defaultdict(lambda: {'calls': 0, 'seconds': 0.0,
+                                           'rows': 0, 'bytes': 0})
+        self.triples = {'count': 0, 'with_results': 0, 'rows': 0}
+
+    def set_output(self, path):
+        """Write json lines for each event to a file, or stop if None"""
+        with self._lock:
+            if self._output is not None:
+                self._output.close()
+            self._output = open(path, 'a') if path is not None else None
+
+    def reset(self):
+        with self._lock:
+            self.start_time = time.time()
+            self.stages.clear()
+            self.triples = {'count': 0, 'with_results': 0, 'rows': 0}
+
+    def add(self, stage, seconds=0.0, rows=0, bytes_=0, calls=1):
+        """Add to the totals for a stage without writing an event"""
+        with self._lock:
+            totals = self.stages[stage]
+            totals['calls'] += calls
+            totals['seconds'] += seconds
+            totals['rows'] += rows
+            totals['bytes'] += bytes_
+
+    @contextmanager
+    def timer(self, stage, **fields):
+        """Time a block of code as one call of a stage
+
+        Yields a dict in which the block can set 'rows' and 'bytes'. The
+        call is added to the totals for the stage and written as an event
+        along with any extra fields.
+        """
+        record = {'rows': 0, 'bytes': 0}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            seconds = time.perf_counter() - start
+            self.add(stage, seconds=seconds, rows=record['rows'],
+                     bytes_=record['bytes'])
+            self.log('stage', stage=stage, seconds=seconds,
+                     rows=record['rows'], bytes=record['bytes'], **fields)
+
+    def add_triple(self, triple, seconds, readings, rows):
+        """Record totals for a single triple"""
+        with self._lock:
+            self.triples['count'] += 1
+            self.triples['with_results'] += bool(rows)
+            self.triples['rows'] += rows
+        self.log('triple', triple=list(triple), seconds=seconds,
+                 readings=readings, rows=rows)
+
+    def log(self, event, **fields):
+        """Write an event as a json line if an output has been set"""
+        if self._output is None:
+            return
+        line = json.dumps({'event': event, 'time': time.time(), **fields},
+                          default=str)
+        with self._lock:
+            if self._output is not None:
+                self._output.write(line + '\n')
+                self._output.flush()
+
+    def get_summary(self, cache_stats=None):
+        """Return dict summarizing the run
+
+        Parameters
+        ----------
+        cache_stats : Optional[dict]
+            Hit and miss counts for caches used during the run, included
+            in the summary as is.
+        """
+        with self._lock:
+            summary = {'wall_seconds': time.time() - self.start_time,
+                       'triples': dict(self.triples),
+                       'stages': {stage: dict(totals) for stage, totals
+                                  in sorted(self.stages.items())}}
+        if cache_stats is not None:
+            summary['caches'] = cache_stats
+        return summary
+
+    def write_summary(self, cache_stats=None):
+        """Write the summary as a final event and return it"""
+        summary = self.get_summary(cache_stats)
+        self.log('summary', **summary)
+        return summary
+
+
+#: Metrics shared by query_indra_db and reach_output
+METRICS = Metrics()
+
+
+def profile_call(path, func, *args, **kwargs):
+    """Run a function under cProfile and dump the stats to a file
+
+    Parameters
+    ----------
+    path : str
+        File to dump stats to. Read them with pstats.Stats(path).
+    func : callable
+        Function to profile. Remaining arguments are passed to it.
+
+    Returns
+    -------
+    object
+        The value returned by func.
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(path)
@@ -0,0 +1,97 @@
+"""Run dataset generation for many triples concurrently."""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+
+def imap_ordered(func, items, n_workers=4, max_pending=None):
+    """Apply function to items in a thread pool, yielding results in order
+
+    At most max_pending items are submitted ahead of the result currently
+    being waited on, so memory use stays bounded for long inputs and
+    results can be checkpointed as they arrive. Items not yet started are
+    cancelled if the generator is closed early.
+
+    Parameters
+    ----------
+    func : callable
+        Function of one argument to apply to each item.
+    items : iterable
+        Inputs to func.
+    n_workers : Optional[int]
+        Number of worker threads. Default: 4
+    max_pending : Optional[int]
+        Maximum number of submitted items whose results have not yet been
+        yielded. Default: twice n_workers
+
+    Returns
+    -------
+    generator
+        Yields tuples of the form (item, func(item)) in the order of items.
+    """
+    if max_pending is None:
+        max_pending = 2 * n_workers
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        pending = deque((item, executor.submit(func, item))
+                        for item in islice(items, max_pending))
+        try:
+            while pending:
+                item, future = pending.popleft()
+                for next_item in islice(items, 1):
+                    pending.append((next_item,
+                                    executor.submit(func, next_item)))
+                yield item, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+
+def run_triples(triples, n_workers=4, batch_size=50, neighbor_cutoff=20,
+                sentence_window=None):
+    """Get reach causality DataFrames for triples using many workers
+
+    Triples are split into batches which are each handled with
+    get_reach_causality_dataframe_for_triples by a pool of worker threads.
+    Workers share a pool of n_workers database connections, so the number
+    of queries in flight is bounded by the number of workers.
+
+    Parameters
+    ----------
+    triples : iterable of tuple
+        Tuples of the form (curie1, curie2, curie3).
+    n_workers : Optional[int]
+        Number of worker threads and database connections. Default: 4
+    batch_size : Optional[int]
+        Number of triples handled by each call to
+        get_reach_causality_dataframe_for_triples. Default: 50
+    neighbor_cutoff : Optional[int]
+        See get_reach_causality_dataframe_for_triple.
+    sentence_window : Optional[int]
+        See get_reach_causality_dataframe_for_triple.
+
+    Returns
+    -------
+    generator
+        Yields tuples of the form (triple, df) in the order of the input,
+        where df is the DataFrame of training examples for the triple or
+        None if none were found.
+    """
+    # Imported here so that imap_ordered can be used without indra_db
+    from .query_indra_db import set_pool_size
+    from .reach_output import get_reach_causality_dataframe_for_triples
+
+    set_pool_size(n_workers)
+    triples = iter(triples)
+    batches = iter(lambda: list(islice(triples, batch_size)), [])
+
+    def _run_batch(batch):
+        return get_reach_causality_dataframe_for_triples(
+            batch, neighbor_cutoff=neighbor_cutoff,
+            sentence_window=sentence_window)
+
+    for batch, results in imap_ordered(_run_batch, batches,
+                                       n_workers=n_workers):
+        for triple in batch:
+            yield triple, results[tuple(triple)]
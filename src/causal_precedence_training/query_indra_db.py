@@ -1,24 +1,277 @@
 import json
-from sqlalchemy import text
+import threading
+import time
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.orm import Session
 from functools import lru_cache
+from itertools import islice
 from contextlib import contextmanager
 
 from indra_db.util import get_db
 from indra_db.util.helpers import unpack
 
+from .metrics import METRICS
+from .sentence_index import ReadingSentenceIndex
+
+
+#: Maximum number of connections held open to each database. This also
+#: bounds the number of queries in flight at once across threads.
+POOL_SIZE = 8
+#: Number of ids bound in each IN list. Larger id sets are split into
+#: chunks of this size, each queried separately.
+CHUNK_SIZE = 5000
+#: Number of rows fetched from the server side cursor at a time.
+YIELD_PER = 1000
+
+_engines = {}
+_engines_lock = threading.Lock()
+_query_slots = threading.BoundedSemaphore(POOL_SIZE)
+_cache = None
+_backend_url = None
+
+
+def set_pool_size(pool_size):
+    """Set the maximum number of concurrent connections to each database
+
+    Engines that have already been created are disposed of so that new
+    connections respect the new size.
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of connections, and therefore of queries in flight,
+        for each database.
+    """
+    global POOL_SIZE, _query_slots
+    with _engines_lock:
+        POOL_SIZE = pool_size
+        _query_slots = threading.BoundedSemaphore(pool_size)
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def set_backend(url=None):
+    """Set the database that queries are run against
+
+    Parameters
+    ----------
+    url : Optional[str]
+        sqlalchemy url of the database to query instead of indra_db, such
+        as f'sqlite:///{path}' for a local snapshot created with
+        causal_precedence_training.snapshot. If None, queries go to the
+        indra_db configured for indra_db.util.get_db. Default: None
+    """
+    global _backend_url
+    with _engines_lock:
+        _backend_url = url
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+def get_backend():
+    """Return url of the database queried instead of indra_db, if any"""
+    return _backend_url
+
+
+def get_engine(db_label='primary', protected=False):
+    """Get pooled sqlalchemy engine for indra_db shared across threads
+
+    The engine is created on first use from the database url indra_db
+    is configured with, or from the url set with set_backend, and then
+    reused by all later calls.
+    """
+    key = _backend_url or (db_label, protected)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            if _backend_url is not None:
+                url = _backend_url
+            else:
+                db = get_db(db_label, protected)
+                url = db.engine.url
+                db.session.close()
+                db.engine.dispose()
+            connect_args = {'check_same_thread': False} \
+                if str(url).startswith('sqlite') else {}
+            engine = create_engine(url, pool_size=POOL_SIZE, max_overflow=0,
+                                   pool_pre_ping=True,
+                                   connect_args=connect_args)
+            _engines[key] = engine
+    return engine
+
+
+def get_dialect():
+    """Return name of the sqlalchemy dialect of the database queried"""
+    return get_engine().dialect.name
+
 
 @contextmanager
-def managed_db(db_label='primary', protected=False):
-    """Get indra_db handle managed with contextmanager
+def managed_session(db_label='primary', protected=False):
+    """Get session on pooled indra_db engine managed with contextmanager
+
+    Cleans up even if an error occurs while session is open. Blocks while
+    POOL_SIZE sessions are already open so callers from many threads never
+    time out waiting for a connection.
+    """
+    engine = get_engine(db_label, protected)
+    slots = _query_slots
+    with slots:
+        session = Session(bind=engine)
+        try:
+            yield session
+        finally:
+            session.rollback()
+            session.close()
 
-    Cleans up even if an error occurs while handle is open
+
+def set_cache(cache):
+    """Set the QueryCache used for lookups, or None to disable caching
+
+    Parameters
+    ----------
+    cache : causal_precedence_training.cache.QueryCache or None
+        Cache for pair lookups, reach support, raw statement jsons and
+        compressed readings.
+    """
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    """Return the QueryCache used for lookups, or None if there isn't one"""
+    return _cache
+
+
+def _iter_with_cache(kind, keys, fetch, flush_every=1000):
+    """Yield (key, value) pairs from the cache, fetching those missing
+
+    fetch takes a list of keys and yields (key, value) tuples. Newly
+    fetched values are added to the cache every flush_every values.
+    """
+    cache = _cache
+    if cache is None:
+        yield from fetch(keys)
+        return
+    keys = list(dict.fromkeys(keys))
+    # Cached values are streamed a batch at a time so that only the keys
+    # found, not their values, are held for the whole lookup
+    found = set()
+    for cached in cache.iter_many(kind, keys):
+        found.update(cached)
+        yield from cached.items()
+    missing = [key for key in keys if key not in found]
+    if not missing:
+        return
+    new = {}
+    for key, value in fetch(missing):
+        new[key] = value
+        if len(new) >= flush_every:
+            cache.put_many(kind, new)
+            new = {}
+        yield key, value
+    cache.put_many(kind, new)
+
+
+def _iter_grouped_with_cache(kind, keys, fetch):
+    """Yield result rows from the cache, fetching those for missing keys
+
+    fetch takes a list of keys and yields rows whose first element is the
+    key they belong to. All rows for a key are cached together, including
+    an empty list for keys with no rows, so that lookups that found
+    nothing aren't repeated.
     """
-    db = get_db(db_label, protected)
-    try:
-        yield db
-    finally:
-        db.session.rollback()
-        db.session.close()
+    cache = _cache
+    if cache is None:
+        yield from fetch(keys)
+        return
+    keys = list(dict.fromkeys(keys))
+    found = set()
+    for cached in cache.iter_many(kind, keys):
+        found.update(cached)
+        for key, rows in cached.items():
+            for row in rows:
+                yield (key, *row)
+    missing = [key for key in keys if key not in found]
+    if not missing:
+        return
+    new = {key: [] for key in missing}
+    for key, *row in fetch(missing):
+        new[key].append(tuple(row))
+        yield (key, *row)
+    cache.put_many(kind, new)
+
+
+def iter_chunked_query(query, values, get_params, chunk_size=None,
+                       yield_per=None):
+    """Run a query over chunks of a set of values, streaming result rows
+
+    The query is executed once per chunk of values within a single session
+    and rows are streamed from a server side cursor while the session is
+    still open. The session is held until the generator is exhausted or
+    closed.
+
+    Parameters
+    ----------
+    query : str or sqlalchemy.sql.expression.TextClause
+        The SQL query to run.
+    values : iterable
+        Values to split into chunks. Duplicates are dropped.
+    get_params : callable
+        Function taking a list of values and returning the dict of bind
+        parameters for the query for that chunk.
+    chunk_size : Optional[int]
+        Number of values in each chunk. Default: CHUNK_SIZE
+    yield_per : Optional[int]
+        Number of rows to fetch from the cursor at a time. Default:
+        YIELD_PER
+
+    Returns
+    -------
+    generator of tuple
+        Yields result rows.
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    yield_per = yield_per or YIELD_PER
+    if isinstance(query, str):
+        query = text(query)
+    values = iter(dict.fromkeys(values))
+    chunk = list(islice(values, chunk_size))
+    if not chunk:
+        return
+    with managed_session() as session:
+        while chunk:
+            res = session.execute(query, get_params(chunk),
+                                  execution_options={'stream_results': True})
+            for row in res.yield_per(yield_per):
+                yield tuple(row)
+            chunk = list(islice(values, chunk_size))
+
+
+def iter_in_query(query, param_name, values, **kwargs):
+    """Run a query with an IN list over chunks of values
+
+    Parameters
+    ----------
+    query : str
+        The SQL query to run. Should contain f'IN :{param_name}'.
+    param_name : str
+        Name of the bind parameter for the IN list.
+    values : iterable
+        Values for the IN list.
+    **kwargs
+        Passed on to iter_chunked_query.
+
+    Returns
+    -------
+    generator of tuple
+        Yields result rows.
+    """
+    query = text(query).bindparams(bindparam(param_name, expanding=True))
+    return iter_chunked_query(query, values,
+                              lambda chunk: {param_name: chunk},
+                              **kwargs)
 
 
 @lru_cache(maxsize=1024)
@@ -40,46 +293,147 @@ def get_pa_statements_for_pair(curie1, curie2):
         Dictionary mapping stmt_mk_hashes for preassembled statements to
         statement types.
     """
-    query = """--
+    return get_pa_statements_for_pairs([(curie1, curie2)])[curie1, curie2]
+
+
+def get_pa_statements_for_pairs(pairs, **kwargs):
+    """Return info for preassembled statements connecting many pairs
+
+    Pairs are looked up in bulk by joining pa_agents against a relation
+    built from the input pairs with unnest, one query per chunk of pairs.
+
+    Parameters
+    ----------
+    pairs : iterable of tuple
+        Tuples of the form (curie1, curie2) where curie1 is the curie for
+        the subject and curie2 is the curie for the object. See
+        get_pa_statements_for_pair.
+    **kwargs
+        Passed on to iter_chunked_query.
+
+    Returns
+    -------
+    dict
+        Dictionary mapping each input pair to a dictionary mapping
+        stmt_mk_hashes for preassembled statements connecting the pair to
+        statement types.
+    """
+    pairs = list(pairs)
+    results = {tuple(pair): {} for pair in pairs}
+    with METRICS.timer('pair_lookup', pairs=len(results)) as record:
+        for pair, stmt_mk_hash, stmt_type in \
+                iter_pa_statements_for_pairs(pairs, **kwargs):
+            results[pair][stmt_mk_hash] = stmt_type
+            record['rows'] += 1
+    return results
+
+
+def iter_pa_statements_for_pairs(pairs, **kwargs):
+    """Generator variant of get_pa_statements_for_pairs
+
+    Returns
+    -------
+    generator of tuple
+        Yields tuples of the form ((curie1, curie2), stmt_mk_hash,
+        stmt_type) for each preassembled statement connecting an input pair.
+    """
+    postgres_query = """--
+    SELECT
+        pairs.db_ns1, pairs.db_id1, pairs.db_ns2, pairs.db_id2,
+        pa1.stmt_mk_hash, pa1.db_name, pa1.db_id,
+        pa2.db_name, pa2.db_id, ps.type
+    FROM
+        unnest(:db_ns1, :db_id1, :db_ns2, :db_id2)
+        AS pairs(db_ns1, db_id1, db_ns2, db_id2)
+    INNER JOIN
+        pa_agents pa1
+    ON
+        MD5(pa1.db_name || pa1.db_id) = MD5(pairs.db_ns1 || pairs.db_id1) AND
+        pa1.role = 'SUBJECT'
+    INNER JOIN
+        pa_agents pa2
+    ON
+        pa1.stmt_mk_hash = pa2.stmt_mk_hash AND
+        MD5(pa2.db_name || pa2.db_id) = MD5(pairs.db_ns2 || pairs.db_id2) AND
+        pa2.role = 'OBJECT'
+    INNER JOIN
+        pa_statements ps
+    ON
+        pa2.stmt_mk_hash = ps.mk_hash
+    """
+    # Local snapshots index pa_agents on (db_name, db_id, role) directly and
+    # receive the pairs as a json array since SQLite has no unnest
+    sqlite_query = """--
     SELECT
+        pairs.db_ns1, pairs.db_id1, pairs.db_ns2, pairs.db_id2,
         pa1.stmt_mk_hash, pa1.db_name, pa1.db_id,
-        pa2.db_name, pa2.db_id, ps.type, ps.json
+        pa2.db_name, pa2.db_id, ps.type
     FROM
+        (SELECT
+            json_extract(value, '$[0]') AS db_ns1,
+            json_extract(value, '$[1]') AS db_id1,
+            json_extract(value, '$[2]') AS db_ns2,
+            json_extract(value, '$[3]') AS db_id2
+         FROM json_each(:pairs)) pairs
+    INNER JOIN
         pa_agents pa1
+    ON
+        pa1.db_name = pairs.db_ns1 AND pa1.db_id = pairs.db_id1 AND
+        pa1.role = 'SUBJECT'
     INNER JOIN
         pa_agents pa2
     ON
         pa1.stmt_mk_hash = pa2.stmt_mk_hash AND
-        MD5(pa1.db_name || pa1.db_id) = MD5(:db_ns1 || :db_id1) AND
-        MD5(pa2.db_name || pa2.db_id) = MD5(:db_ns2 || :db_id2) AND
-        pa1.role = 'SUBJECT' AND pa2.role = 'OBJECT'
+        pa2.db_name = pairs.db_ns2 AND pa2.db_id = pairs.db_id2 AND
+        pa2.role = 'OBJECT'
     INNER JOIN
         pa_statements ps
     ON
         pa2.stmt_mk_hash = ps.mk_hash
     """
-    db_ns1, db_id1 = curie1.split(':', maxsplit=1)
-    db_ns2, db_id2 = curie2.split(':', maxsplit=1)
-    with managed_db() as db:
-        res = db.session.execute(text(query),
-                                 {'db_ns1': db_ns1, 'db_id1': db_id1,
-                                  'db_ns2': db_ns2, 'db_id2': db_id2})
-    # Although absurdly unlikely, we filter MD5 hash collisions just
-    # on principle. Also filter complexes with more than two members
-    return {stmt_mk_hash: stmt_type for
-            stmt_mk_hash, db_name1, id1, db_name2, id2,
-            stmt_type, stmt_json in res
-            if db_name1 == db_ns1 and id1 == db_id1 and
-            db_name2 == db_ns2 and id2 == db_id2}
-
-
-def get_reach_support_for_pa_statements(stmt_mk_hashes):
+
+    def get_postgres_params(chunk):
+        db_ns1, db_id1, db_ns2, db_id2 = (list(column)
+                                          for column in zip(*chunk))
+        return {'db_ns1': db_ns1, 'db_id1': db_id1,
+                'db_ns2': db_ns2, 'db_id2': db_id2}
+
+    def get_sqlite_params(chunk):
+        return {'pairs': json.dumps(chunk)}
+
+    def fetch(pairs):
+        if get_dialect() == 'sqlite':
+            query, get_params = sqlite_query, get_sqlite_params
+        else:
+            query, get_params = postgres_query, get_postgres_params
+        split_pairs = {(curie1, curie2): (*curie1.split(':', maxsplit=1),
+                                          *curie2.split(':', maxsplit=1))
+                       for curie1, curie2 in pairs}
+        curie_lookup = {split: pair for pair, split in split_pairs.items()}
+        res = iter_chunked_query(query, split_pairs.values(), get_params,
+                                 **kwargs)
+        # Although absurdly unlikely, we filter MD5 hash collisions just
+        # on principle. Also filter complexes with more than two members
+        for (ns1, id1, ns2, id2, stmt_mk_hash, db_name1, agent_id1,
+             db_name2, agent_id2, stmt_type) in res:
+            if db_name1 == ns1 and agent_id1 == id1 and \
+                    db_name2 == ns2 and agent_id2 == id2:
+                yield (curie_lookup[ns1, id1, ns2, id2], stmt_mk_hash,
+                       stmt_type)
+
+    return _iter_grouped_with_cache(
+        'pa_statements_for_pair', (tuple(pair) for pair in pairs), fetch)
+
+
+def get_reach_support_for_pa_statements(stmt_mk_hashes, **kwargs):
     """Return reading_ids and raw_stmt_ids of reach support for input
 
     Parameters
     ----------
     stmt_mk_hashes : list of int
         List of stmt_mk_hashes for preassembled statements
+    **kwargs
+        Passed on to iter_chunked_query.
 
     Returns
     -------
@@ -106,50 +460,338 @@ def get_reach_support_for_pa_statements(stmt_mk_hashes):
         rs.reading_id = rd.id AND
         rd.reader = 'REACH'
     """
-    with managed_db() as db:
-        res = db.session.execute(text(query),
-                                 {'stmt_mk_hashes': tuple(set(stmt_mk_hashes))})
-    return ((stmt_mk_hash, raw_stmt_id,
-             reading_id) for stmt_mk_hash, raw_stmt_id, reading_id
-            in res)
+    return _iter_grouped_with_cache(
+        'reach_support', stmt_mk_hashes,
+        lambda stmt_mk_hashes: iter_in_query(query, 'stmt_mk_hashes',
+                                             stmt_mk_hashes, **kwargs))
+
+
+def get_reading_counts_for_pa_statements(stmt_mk_hashes, **kwargs):
+    """Return number of readings with raw support for each input statement
 
+    This is a cheap estimate of the work needed to handle a statement,
+    made without touching the reading table. Readings from all readers
+    are counted, not only REACH.
 
-def get_readings_for_reading_ids(reading_ids):
+    Parameters
+    ----------
+    stmt_mk_hashes : list of int
+        List of stmt_mk_hashes for preassembled statements
+    **kwargs
+        Passed on to iter_chunked_query.
+
+    Returns
+    -------
+    dict
+        dict mapping each input stmt_mk_hash to the number of distinct
+        readings of raw statements supporting it.
+    """
+    query = """--
+    SELECT rl.pa_stmt_mk_hash, COUNT(DISTINCT rs.reading_id)
+    FROM
+        raw_unique_links rl
+    INNER JOIN
+        raw_statements rs
+    ON
+        rl.pa_stmt_mk_hash IN :stmt_mk_hashes AND
+        rl.raw_stmt_id = rs.id
+    GROUP BY rl.pa_stmt_mk_hash
+    """
+
+    def fetch(stmt_mk_hashes):
+        missing = set(stmt_mk_hashes)
+        for stmt_mk_hash, count in iter_in_query(query, 'stmt_mk_hashes',
+                                                 stmt_mk_hashes, **kwargs):
+            missing.discard(stmt_mk_hash)
+            yield stmt_mk_hash, count
+        # Statements without support are cached too
+        for stmt_mk_hash in missing:
+            yield stmt_mk_hash, 0
+
+    return dict(_iter_with_cache('reading_count', stmt_mk_hashes, fetch))
+
+
+def iter_reach_statement_agents_by_reading(reading_ids=None, **kwargs):
+    """Stream subjects and objects of REACH raw statements by reading
+
+    Parameters
+    ----------
+    reading_ids : Optional[iterable of int]
+        reading ids for rows in readings table. If None, every REACH
+        reading is scanned in a single streamed query. Default: None
+    **kwargs
+        Passed on to iter_chunked_query.
+
+    Returns
+    -------
+    generator of tuple
+        Yields tuples of the form
+        (reading_id, raw_stmt_id, stmt_type, role, db_name, db_id)
+        with one tuple for each grounding of the subject and object of the
+        preassembled statement each raw statement supports. Rows for the
+        same reading are consecutive, so they can be grouped with
+        itertools.groupby.
+    """
+    query = """--
+    SELECT
+        rs.reading_id, rs.id, ps.type, pa.role, pa.db_name, pa.db_id
+    FROM
+        reading rd
+    INNER JOIN
+        raw_statements rs
+    ON
+        rs.reading_id = rd.id AND
+        rd.reader = 'REACH'
+    INNER JOIN
+        raw_unique_links rl
+    ON
+        rl.raw_stmt_id = rs.id
+    INNER JOIN
+        pa_statements ps
+    ON
+        rl.pa_stmt_mk_hash = ps.mk_hash
+    INNER JOIN
+        pa_agents pa
+    ON
+        pa.stmt_mk_hash = ps.mk_hash AND
+        pa.role IN ('SUBJECT', 'OBJECT')
+    {where}
+    ORDER BY
+        rs.reading_id, rs.id
+    """
+    if reading_ids is not None:
+        # Each reading falls in exactly one chunk, so ordering within
+        # chunks keeps rows for a reading together.
+        return iter_in_query(
+            query.format(where='WHERE rd.id IN :reading_ids'),
+            'reading_ids', reading_ids, **kwargs)
+    # A single chunk with no bind parameters streams the whole scan
+    return iter_chunked_query(query.format(where=''), [None],
+                              lambda chunk: {}, **kwargs)
+
+
+def iter_reach_reading_id_batches(batch_size=None):
+    """Stream the ids of all REACH readings in batches
+
+    Batches are read by keyset pagination, each in its own session that
+    is closed before the batch is yielded, so no session or transaction is
+    held between batches.
+
+    Parameters
+    ----------
+    batch_size : Optional[int]
+        Number of reading ids in each batch. Default: CHUNK_SIZE
+
+    Returns
+    -------
+    generator of list of int
+        Yields lists of reading ids in ascending order.
+    """
+    batch_size = batch_size or CHUNK_SIZE
+    query = text("""--
+    SELECT
+        id
+    FROM
+        reading
+    WHERE
+        reader = 'REACH' AND
+        id > :after
+    ORDER BY
+        id
+    LIMIT :limit
+    """)
+    after = -1
+    while True:
+        with managed_session() as session:
+            res = session.execute(query, {'after': after,
+                                          'limit': batch_size})
+            reading_ids = [reading_id for reading_id, in res]
+        if not reading_ids:
+            return
+        yield reading_ids
+        after = reading_ids[-1]
+
+
+def get_readings_for_reading_ids(reading_ids, sentence_index_only=False,
+                                 **kwargs):
     """Get json output associated to reading ids
 
     Parameters
     ----------
     reading_ids : list of ints
         reading ids for rows in readings table
+    sentence_index_only : Optional[bool]
+        If True, return only a compact ReadingSentenceIndex for each
+        reading instead of the full reading output. The full json is
+        discarded as soon as the index has been built. Default: False
+    **kwargs
+        Passed on to iter_chunked_query.
 
     Returns
     -------
     dict
-        dict mapping reading ids to jsons of reading output
+        dict mapping reading ids to jsons of reading output, or to sentence
+        indices if sentence_index_only is True.
+    """
+    return dict(iter_readings_for_reading_ids(
+        reading_ids, sentence_index_only=sentence_index_only, **kwargs))
+
+
+def iter_readings_for_reading_ids(reading_ids, sentence_index_only=False,
+                                  **kwargs):
+    """Generator variant of get_readings_for_reading_ids
+
+    Returns
+    -------
+    generator of tuple
+        Yields tuples of the form (reading_id, reach_json), or
+        (reading_id, sentence_index) if sentence_index_only is True.
+    """
+    for reading_id, bytes_ in \
+            iter_compressed_readings_for_reading_ids(reading_ids, **kwargs):
+        start = time.perf_counter()
+        unpacked = unpack(bytes_)
+        unpacked_time = time.perf_counter()
+        reach_json = json.loads(unpacked)
+        parsed_time = time.perf_counter()
+        METRICS.add('reading_unpack', seconds=unpacked_time - start,
+                    bytes_=len(unpacked))
+        METRICS.add('reading_json_parse', seconds=parsed_time - unpacked_time)
+        if sentence_index_only:
+            sentence_index = ReadingSentenceIndex.from_reach_json(reach_json)
+            METRICS.add('sentence_index_build',
+                        seconds=time.perf_counter() - parsed_time)
+            yield reading_id, sentence_index
+        else:
+            yield reading_id, reach_json
+
+
+def get_compressed_readings_for_reading_ids(reading_ids, **kwargs):
+    """Get compressed output associated to reading ids
+
+    Parameters
+    ----------
+    reading_ids : list of ints
+        reading ids for rows in readings table
+    **kwargs
+        Passed on to iter_chunked_query.
+
+    Returns
+    -------
+    dict
+        dict mapping reading ids to reading output as it is stored in the
+        database. Use indra_db.util.helpers.unpack to decompress.
+    """
+    return dict(iter_compressed_readings_for_reading_ids(reading_ids,
+                                                         **kwargs))
+
+
+def iter_compressed_readings_for_reading_ids(reading_ids, use_cache=True,
+                                             **kwargs):
+    """Generator variant of get_compressed_readings_for_reading_ids
+
+    Parameters
+    ----------
+    reading_ids : iterable of int
+        reading ids for rows in readings table
+    use_cache : Optional[bool]
+        If False, readings are streamed straight from the database, and
+        neither looked up in nor added to the QueryCache. Use this for
+        readings that are only needed once, so that they don't evict
+        useful entries and aren't buffered to be cached. Default: True
+    **kwargs
+        Passed on to iter_chunked_query.
+
+    Returns
+    -------
+    generator of tuple
+        Yields tuples of the form (reading_id, compressed_bytes).
     """
     query = 'SELECT id, bytes FROM reading WHERE id IN :reading_ids'
-    with managed_db() as db:
-        res = db.session.execute(text(query),
-                                 {'reading_ids': tuple(set(reading_ids))})
-    return {reading_id: json.loads(unpack(bytes_))
-            for reading_id, bytes_ in res}
 
+    def fetch(reading_ids):
+        for reading_id, bytes_ in iter_in_query(query, 'reading_ids',
+                                                reading_ids, **kwargs):
+            bytes_ = bytes(bytes_)
+            METRICS.add('reading_fetch', rows=1, bytes_=len(bytes_),
+                        calls=0)
+            yield reading_id, bytes_
 
-def get_raw_statement_jsons(stmt_ids):
+    if not use_cache:
+        return fetch(reading_ids)
+    return _iter_with_cache('reading', reading_ids, fetch)
+
+
+def get_raw_statement_jsons(stmt_ids, evidence_text_only=False, **kwargs):
     """Get statement jsons associated to each in a list of raw statement ids
 
     Parameters
     ----------
     stmt_ids : list of int
         list of raw statement ids
+    evidence_text_only : Optional[bool]
+        If True, extract the text of the first evidence of each statement
+        within the database and return only that instead of the full
+        statement json. Default: False
+    **kwargs
+        Passed on to iter_chunked_query.
 
     Returns
     --------
     dict
-        dict mapping raw statement ids to statement jsons.
+        dict mapping raw statement ids to statement jsons, or to evidence
+        texts if evidence_text_only is True.
     """
+    return dict(iter_raw_statement_jsons(
+        stmt_ids, evidence_text_only=evidence_text_only, **kwargs))
+
+
+def iter_raw_statement_jsons(stmt_ids, evidence_text_only=False, **kwargs):
+    """Generator variant of get_raw_statement_jsons
+
+    Returns
+    -------
+    generator of tuple
+        Yields tuples of the form (raw_stmt_id, stmt_json), or
+        (raw_stmt_id, evidence_text) if evidence_text_only is True.
+    """
+    if evidence_text_only:
+        postgres_query = """--
+        SELECT
+            id, convert_from(json, 'UTF8')::jsonb #>> '{evidence,0,text}'
+        FROM
+            raw_statements
+        WHERE
+            id IN :stmt_ids
+        """
+        sqlite_query = """--
+        SELECT
+            id, json_extract(CAST(json AS TEXT), '$.evidence[0].text')
+        FROM
+            raw_statements
+        WHERE
+            id IN :stmt_ids
+        """
+
+        def fetch_texts(stmt_ids):
+            query = sqlite_query if get_dialect() == 'sqlite' \
+                else postgres_query
+            for stmt_id, evidence_text in iter_in_query(query, 'stmt_ids',
+                                                        stmt_ids, **kwargs):
+                METRICS.add('evidence_text_fetch', rows=1, calls=0,
+                            bytes_=len(evidence_text or ''))
+                yield stmt_id, evidence_text
+
+        return _iter_with_cache('raw_statement_evidence_text', stmt_ids,
+                                fetch_texts)
     query = 'SELECT id, json FROM raw_statements WHERE id in :stmt_ids'
-    with managed_db() as db:
-        res = db.session.execute(text(query),
-                                 {'stmt_ids': tuple(set(stmt_ids))})
-    return {stmt_id: json.loads(json_.tobytes()) for stmt_id, json_ in res}
+
+    def fetch(stmt_ids):
+        for stmt_id, json_ in iter_in_query(query, 'stmt_ids', stmt_ids,
+                                            **kwargs):
+            json_ = bytes(json_)
+            METRICS.add('raw_statement_fetch', rows=1, bytes_=len(json_),
+                        calls=0)
+            yield stmt_id, json.loads(json_)
+
+    return _iter_with_cache('raw_statement_json', stmt_ids, fetch)
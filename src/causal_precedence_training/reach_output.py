@@ -1,14 +1,28 @@
+import time
+import logging
+import numpy as np
 import pandas as pd
 from ast import literal_eval
 from collections import defaultdict
 
 
 from .query_indra_db import get_raw_statement_jsons
-from .query_indra_db import get_pa_statements_for_pair
+from .query_indra_db import get_pa_statements_for_pairs
 from .query_indra_db import get_readings_for_reading_ids
 from .query_indra_db import get_reach_support_for_pa_statements
+from .metrics import METRICS
+from .sentence_index import ReadingSentenceIndex, SENTENCE_INDEX_CACHE
 
 
+logger = logging.getLogger(__name__)
+
+
+DATAFRAME_COLUMNS = ['agent1', 'stmt_type1',
+                     'agent2', 'stmt_type2',
+                     'agent3', 'text1', 'text2',
+                     'sentence_id1', 'sentence_id2',
+                     'reading_id']
+
 def get_reach_support_for_triple(curie1, curie2, curie3):
     """Get reach support for triple A -> B -> C
 
@@ -35,37 +49,107 @@ def get_reach_support_for_triple(curie1, curie2, curie3):
         (raw_stmt_id, statement_type) for statements connecting 
         A -> B (B -> C).
     """
+    triple = (curie1, curie2, curie3)
+    return get_reach_support_for_triples([triple])[triple]
+
+
+def get_reach_support_for_triples(triples):
+    """Get reach support for many triples A -> B -> C at once
+
+    Pairs and statements shared between triples are only queried once.
+    A single query is made to find preassembled statements for all unique
+    pairs and another is made to find reach support for all of the
+    resulting statements.
+
+    Parameters
+    ----------
+    triples : iterable of tuple
+        Tuples of the form (curie1, curie2, curie3). See
+        get_reach_support_for_triple.
+
+    Returns
+    -------
+    dict
+        dict mapping each input triple to the output that
+        get_reach_support_for_triple would give for it.
+    """
+    triples = list(dict.fromkeys(tuple(triple) for triple in triples))
+    pairs = set()
+    for curie1, curie2, curie3 in triples:
+        pairs.add((curie1, curie2))
+        pairs.add((curie2, curie3))
     # These are dictionaries mapping stmt_mk_hashes to statement types
-    mk_hash_dict1 = get_pa_statements_for_pair(curie1, curie2)
-    mk_hash_dict2 = get_pa_statements_for_pair(curie2, curie3)
-    # If no statements found for either pair, return an empty dict
-    if not mk_hash_dict1 or not mk_hash_dict2:
-        return {}
-    reach_support_AB = get_reach_support_for_pa_statements(mk_hash_dict1.keys())
-    reach_support_BC = get_reach_support_for_pa_statements(mk_hash_dict2.keys())
-    # Convert into dicts mapping reading_ids to tuples of raw statement ids
-    # and statement types for A->B link and B->C link respectively
-    reading_dict_AB = defaultdict(list)
-    reading_dict_BC = defaultdict(list)
-    for stmt_mk_hash, raw_stmt_id, reading_id in reach_support_AB:
-        reading_dict_AB[reading_id].append((raw_stmt_id,
-                                            mk_hash_dict1[stmt_mk_hash]))
-    for stmt_mk_hash, raw_stmt_id, reading_id in reach_support_BC:
-        reading_dict_BC[reading_id].append((raw_stmt_id,
-                                            mk_hash_dict2[stmt_mk_hash]))
-    # Keep only cases with A->B and B->C link in same REACH reading of same
-    # paper.
-    keep = reading_dict_AB.keys() & reading_dict_BC.keys()
-    reading_dict_AB = {reading_id: stmts for reading_id,
-                       stmts in reading_dict_AB.items()
-                       if reading_id in keep}
-    reading_dict_BC = {reading_id: stmts for reading_id,
-                       stmts in reading_dict_BC.items()
-                       if reading_id in keep}
-    # Return in desired output format
-    return {reading_id: {'A->B': reading_dict_AB[reading_id],
-                         'B->C': reading_dict_BC[reading_id]}
-            for reading_id in keep}
+    mk_hash_dicts = get_pa_statements_for_pairs(pairs)
+    # A statement may connect more than one pair when agents are grounded
+    # to several namespaces, so keep track of all of them.
+    mk_hash_to_pairs = defaultdict(list)
+    for pair, mk_hash_dict in mk_hash_dicts.items():
+        for stmt_mk_hash in mk_hash_dict:
+            mk_hash_to_pairs[stmt_mk_hash].append(pair)
+    # Only look up reach support for pairs that appear as A->B in some
+    # triple whose B->C link also has statements, and vice versa
+    needed_pairs = set()
+    for curie1, curie2, curie3 in triples:
+        if mk_hash_dicts[curie1, curie2] and mk_hash_dicts[curie2, curie3]:
+            needed_pairs.add((curie1, curie2))
+            needed_pairs.add((curie2, curie3))
+    stmt_mk_hashes = {stmt_mk_hash for pair in needed_pairs
+                      for stmt_mk_hash in mk_hash_dicts[pair]}
+    # Convert into dicts mapping pairs to dicts mapping reading_ids to
+    # tuples of raw statement ids and statement types
+    pair_reading_dicts = defaultdict(lambda: defaultdict(list))
+    if stmt_mk_hashes:
+        with METRICS.timer('reach_support',
+                           stmt_mk_hashes=len(stmt_mk_hashes)) as record:
+            reach_support = \
+                get_reach_support_for_pa_statements(stmt_mk_hashes)
+            for stmt_mk_hash, raw_stmt_id, reading_id in reach_support:
+                record['rows'] += 1
+                for pair in mk_hash_to_pairs[stmt_mk_hash]:
+                    pair_reading_dicts[pair][reading_id].append(
+                        (raw_stmt_id, mk_hash_dicts[pair][stmt_mk_hash]))
+    results = {}
+    for curie1, curie2, curie3 in triples:
+        reading_dict_AB = pair_reading_dicts.get((curie1, curie2), {})
+        reading_dict_BC = pair_reading_dicts.get((curie2, curie3), {})
+        # Keep only cases with A->B and B->C link in same REACH reading of
+        # same paper.
+        keep = reading_dict_AB.keys() & reading_dict_BC.keys()
+        results[curie1, curie2, curie3] = \
+            {reading_id: {'A->B': reading_dict_AB[reading_id],
+                          'B->C': reading_dict_BC[reading_id]}
+             for reading_id in keep}
+    return results
+
+
+def get_sentence_indices_for_reading_ids(reading_ids,
+                                        cache=SENTENCE_INDEX_CACHE):
+    """Get sentence indices for readings, reusing those already built
+
+    Parameters
+    ----------
+    reading_ids : iterable of int
+        reading ids for rows in readings table
+    cache : Optional[SentenceIndexCache]
+        Cache of sentence indices to check before querying the database
+        and to which newly built indices are added. Defaults to a cache
+        shared across all calls. If None, no caching is done.
+
+    Returns
+    -------
+    dict
+        dict mapping reading ids to ReadingSentenceIndex objects
+    """
+    reading_ids = set(reading_ids)
+    indices = cache.get_many(reading_ids) if cache is not None else {}
+    missing = reading_ids - indices.keys()
+    if missing:
+        new_indices = get_readings_for_reading_ids(missing,
+                                                   sentence_index_only=True)
+        if cache is not None:
+            cache.put_many(new_indices)
+        indices.update(new_indices)
+    return indices
 
 
 def match_up_stmts_to_sentence_positions(stmts_with_json, reach_json):
@@ -86,26 +170,50 @@ def match_up_stmts_to_sentence_positions(stmts_with_json, reach_json):
         form (sentence_id, (start_pos, end_pos)) where sentence_id is the
         id of the evidence sentence within the reach json and start_pos and
         end_pos are the coordinates for the evidence sentence within article
-        as given in the sentence metadata in the reach_json.
+        as given in the sentence metadata in the reach_json. Statements
+        whose evidence text can't be found in the reach json are left out.
     """
-    text_to_sentence_ids = {frame['verbose-text']: frame['sentence'] for
-                            frame in reach_json['events']['frames']
-                            if 'verbose-text' in frame}
-    sentence_positions = {frame['frame-id']: (frame['start-pos']['offset'],
-                                              frame['end-pos']['offset'])
-                          for frame in reach_json['sentences']['frames']
-                          if 'start-pos' in frame}
-    stmts_to_sentence_positions = {}
-    for stmt_id, stmt_json in stmts_with_json.items():
-        evidence_text = stmt_json['evidence'][0]['text']
-        sentence_id = text_to_sentence_ids[evidence_text]
-        stmts_to_sentence_positions[stmt_id] = \
-            (sentence_id, sentence_positions[sentence_id])
-    return stmts_to_sentence_positions
+    stmt_texts = {stmt_id: stmt_json['evidence'][0]['text']
+                  for stmt_id, stmt_json in stmts_with_json.items()}
+    sentence_index = ReadingSentenceIndex.from_reach_json(reach_json)
+    return {stmt_id: sentence_index.get_sentence(row) for stmt_id, row
+            in match_up_texts_to_sentence_rows(stmt_texts,
+                                               sentence_index).items()}
+
+
+def match_up_texts_to_sentence_rows(stmt_texts, sentence_index,
+                                    reading_id=None):
+    """Match up evidence texts to sentences in a ReadingSentenceIndex
+
+    Evidence texts that can't be found in the reading are logged and
+    left out of the result.
+
+    Parameters
+    ----------
+    stmt_texts : dict
+        A dictionary mapping raw statement ids to the text of their
+        first evidence.
+    sentence_index : ReadingSentenceIndex
+        The sentence index for the reading the statements come from.
+    reading_id : Optional[int]
+        The id of the reading. Only used in log messages.
+
+    Returns
+    -------
+    dict
+        A dictionary mapping raw statement ids to rows of the sentence
+        index.
+    """
+    matched, unmatched = sentence_index.match(stmt_texts)
+    for stmt_id, evidence_text in unmatched.items():
+        logger.warning('Evidence text for raw statement %s not found in'
+                       ' reading %s: %r', stmt_id, reading_id, evidence_text)
+    return matched
 
 
 def get_reach_causality_dataframe_for_triple(curie1, curie2, curie3,
-                                             neighbor_cutoff=20):
+                                             neighbor_cutoff=20,
+                                             sentence_window=None):
     """Returns DataFrame of training examples for triple
 
     Parameters
@@ -123,49 +231,222 @@ def get_reach_causality_dataframe_for_triple(curie1, curie2, curie3,
         if the end position in the sentence coordinate of X is within this
         neighbor_cutoff of the start position in the sentence coordinate of
         Y.
+    sentence_window : Optional[int]
+        If given, sentence X is also considered a neighboring predecessor
+        of sentence Y if X is one of the sentence_window sentences
+        preceding Y in the article, regardless of neighbor_cutoff.
+        Default: None
 
     Returns
     -------
     pandas.DataFrame
     """
+    triple = (curie1, curie2, curie3)
+    return get_reach_causality_dataframe_for_triples(
+        [triple], neighbor_cutoff=neighbor_cutoff,
+        sentence_window=sentence_window)[triple]
+
+
+def get_reach_causality_dataframe_for_triples(triples, neighbor_cutoff=20,
+                                              sentence_window=None,
+                                              concat=False):
+    """Returns DataFrames of training examples for many triples at once
+
+    Unique pairs, stmt_mk_hashes, reading ids and raw statement ids are
+    gathered across all of the input triples so that a single query is
+    made for each stage of the pipeline rather than for each triple. In
+    particular, all raw statement jsons are fetched in one pass up front
+    and then sliced per reading.
+
+    Parameters
+    ----------
+    triples : iterable of tuple
+        Tuples of the form (curie1, curie2, curie3). See
+        get_reach_causality_dataframe_for_triple.
+    neighbor_cutoff : Optional[int]
+        See get_reach_causality_dataframe_for_triple.
+    sentence_window : Optional[int]
+        See get_reach_causality_dataframe_for_triple.
+    concat : Optional[bool]
+        If True, return a single DataFrame with the results for all
+        triples concatenated together. Default: False
+
+    Returns
+    -------
+    dict or pandas.DataFrame
+        dict mapping each input triple to the DataFrame that
+        get_reach_causality_dataframe_for_triple would give for it
+        (None if no support was found). If concat is True, a single
+        DataFrame is returned instead.
+    """
+    support = get_reach_support_for_triples(triples)
+    reading_ids = {reading_id for reading_stmts_dict in support.values()
+                   for reading_id in reading_stmts_dict}
+    raw_stmt_ids = {raw_stmt_id for reading_stmts_dict in support.values()
+                    for stmts in reading_stmts_dict.values()
+                    for link in ('A->B', 'B->C')
+                    for raw_stmt_id, _ in stmts[link]}
+    # Only the evidence texts of raw statements and the sentence metadata
+    # of readings are needed, so project them out in the queries. Sentence
+    # indices are shared with other batches of triples through a cache.
+    with METRICS.timer('readings', readings=len(reading_ids)) as record:
+        sentence_indices = get_sentence_indices_for_reading_ids(reading_ids)
+        record['rows'] = len(sentence_indices)
+    with METRICS.timer('evidence_texts', stmts=len(raw_stmt_ids)) as record:
+        stmt_texts = \
+            get_raw_statement_jsons(raw_stmt_ids, evidence_text_only=True) \
+            if raw_stmt_ids else {}
+        record['rows'] = len(stmt_texts)
+    results = {}
+    for triple, reading_stmts_dict in support.items():
+        start = time.perf_counter()
+        if not reading_stmts_dict:
+            results[triple] = None
+            METRICS.add_triple(triple, time.perf_counter() - start, 0, 0)
+            continue
+        rows = []
+        for reading_id, stmts in reading_stmts_dict.items():
+            rows.extend(_get_rows_for_reading(triple, reading_id, stmts,
+                                              sentence_indices[reading_id],
+                                              stmt_texts, neighbor_cutoff,
+                                              sentence_window))
+        results[triple] = pd.DataFrame(rows, columns=DATAFRAME_COLUMNS)
+        seconds = time.perf_counter() - start
+        METRICS.add('pairing', seconds=seconds, rows=len(rows))
+        METRICS.add_triple(triple, seconds, len(reading_stmts_dict),
+                           len(rows))
+    if concat:
+        dfs = [df for df in results.values() if df is not None]
+        if not dfs:
+            return pd.DataFrame(columns=DATAFRAME_COLUMNS)
+        return pd.concat(dfs, ignore_index=True)
+    return results
+
+
+def get_neighboring_sentence_pairs(start_pos1, end_pos1, start_pos2,
+                                   neighbor_cutoff=20, ordinal1=None,
+                                   ordinal2=None, sentence_window=None):
+    """Find pairs of sentences where the first neighbors the second
+
+    A sentence X with coordinates (start_pos1, end_pos1) is paired with a
+    sentence Y starting at start_pos2 if X and Y are the same sentence
+    (have the same start position) or X ends before Y starts and within
+    neighbor_cutoff of Y's start. Rather than testing every combination,
+    the second set of sentences is sorted by start position and the
+    qualifying range for each sentence in the first set is found by
+    binary search.
+
+    Parameters
+    ----------
+    start_pos1 : numpy.ndarray
+        Start positions for the first set of sentences.
+    end_pos1 : numpy.ndarray
+        End positions for the first set of sentences.
+    start_pos2 : numpy.ndarray
+        Start positions for the second set of sentences.
+    neighbor_cutoff : Optional[int]
+        See get_reach_causality_dataframe_for_triple.
+    ordinal1 : Optional[numpy.ndarray]
+        Ordinal positions of the first set of sentences within the
+        article. Only needed if sentence_window is given.
+    ordinal2 : Optional[numpy.ndarray]
+        Ordinal positions of the second set of sentences within the
+        article. Only needed if sentence_window is given.
+    sentence_window : Optional[int]
+        See get_reach_causality_dataframe_for_triple.
+
+    Returns
+    -------
+    idx1 : numpy.ndarray
+        Indices into the first set of sentences.
+    idx2 : numpy.ndarray
+        Indices into the second set of sentences. Pairs (idx1[i], idx2[i])
+        are in the order a nested loop over the first and then the second
+        set would produce them.
+    """
+    start_pos1, end_pos1, start_pos2 = (np.asarray(positions, dtype=np.int64)
+                                        for positions in (start_pos1,
+                                                          end_pos1,
+                                                          start_pos2))
+    order2 = np.argsort(start_pos2, kind='stable')
+    sorted_start2 = start_pos2[order2]
+    # Same sentence
+    ranges = [(np.searchsorted(sorted_start2, start_pos1, side='left'),
+               np.searchsorted(sorted_start2, start_pos1, side='right'),
+               order2)]
+    # end_pos1 < start_pos2 < end_pos1 + neighbor_cutoff
+    ranges.append(
+        (np.searchsorted(sorted_start2, end_pos1, side='right'),
+         np.searchsorted(sorted_start2, end_pos1 + neighbor_cutoff,
+                         side='left'),
+         order2))
+    if sentence_window is not None:
+        ordinal1 = np.asarray(ordinal1, dtype=np.int64)
+        ordinal2 = np.asarray(ordinal2, dtype=np.int64)
+        ordinal_order2 = np.argsort(ordinal2, kind='stable')
+        sorted_ordinal2 = ordinal2[ordinal_order2]
+        # ordinal1 <= ordinal2 <= ordinal1 + sentence_window
+        ranges.append(
+            (np.searchsorted(sorted_ordinal2, ordinal1, side='left'),
+             np.searchsorted(sorted_ordinal2, ordinal1 + sentence_window,
+                             side='right'),
+             ordinal_order2))
+    idx1_parts, idx2_parts = [], []
+    for lo, hi, order in ranges:
+        counts = np.maximum(hi - lo, 0)
+        total = counts.sum()
+        idx1 = np.repeat(np.arange(len(start_pos1)), counts)
+        # Offset of each output element within the range of its idx1
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts,
+                                               counts)
+        idx1_parts.append(idx1)
+        idx2_parts.append(order[np.repeat(lo, counts) + offsets])
+    # Combine criteria, dropping duplicates, in nested loop order
+    keys = np.unique(np.concatenate(idx1_parts) * len(start_pos2) +
+                     np.concatenate(idx2_parts))
+    return keys // max(len(start_pos2), 1), keys % max(len(start_pos2), 1)
+
+
+def _get_rows_for_reading(triple, reading_id, stmts, sentence_index,
+                          stmt_texts, neighbor_cutoff, sentence_window=None):
+    """Return dataset rows for the support of a triple within one reading"""
+    curie1, curie2, curie3 = triple
+    AB_stmts_type_dict = {raw_stmt_id: type_ for raw_stmt_id, type_
+                          in stmts['A->B']}
+    BC_stmts_type_dict = {raw_stmt_id: type_ for raw_stmt_id, type_
+                          in stmts['B->C']}
+    AB_stmt_texts = {raw_stmt_id: stmt_texts[raw_stmt_id]
+                     for raw_stmt_id in AB_stmts_type_dict}
+    BC_stmt_texts = {raw_stmt_id: stmt_texts[raw_stmt_id]
+                     for raw_stmt_id in BC_stmts_type_dict}
+    AB = match_up_texts_to_sentence_rows(AB_stmt_texts, sentence_index,
+                                         reading_id)
+    BC = match_up_texts_to_sentence_rows(BC_stmt_texts, sentence_index,
+                                         reading_id)
+    AB_stmt_ids, AB_rows = list(AB.keys()), np.fromiter(AB.values(),
+                                                        dtype=np.int64,
+                                                        count=len(AB))
+    BC_stmt_ids, BC_rows = list(BC.keys()), np.fromiter(BC.values(),
+                                                        dtype=np.int64,
+                                                        count=len(BC))
+    idx1, idx2 = get_neighboring_sentence_pairs(
+        sentence_index.start_positions[AB_rows],
+        sentence_index.end_positions[AB_rows],
+        sentence_index.start_positions[BC_rows],
+        neighbor_cutoff=neighbor_cutoff,
+        ordinal1=AB_rows, ordinal2=BC_rows,
+        sentence_window=sentence_window)
     rows = []
-    reading_stmts_dict = get_reach_support_for_triple(curie1,
-                                                      curie2,
-                                                      curie3)
-    if not reading_stmts_dict:
-        return None
-    reach_jsons = get_readings_for_reading_ids(reading_stmts_dict.keys())
-    for reading_id, stmts in reading_stmts_dict.items():
-        reach_json = reach_jsons[reading_id]
-        AB_stmts_type_dict = {raw_stmt_id: type_ for raw_stmt_id, type_
-                              in stmts['A->B']}
-        BC_stmts_type_dict = {raw_stmt_id: type_ for raw_stmt_id, type_
-                              in stmts['B->C']}
-        AB_stmt_jsons = get_raw_statement_jsons(AB_stmts_type_dict.keys())
-        BC_stmt_jsons = get_raw_statement_jsons(BC_stmts_type_dict.keys())
-        AB = match_up_stmts_to_sentence_positions(AB_stmt_jsons, reach_json)
-        BC = match_up_stmts_to_sentence_positions(BC_stmt_jsons, reach_json)
-        for stmt_id1, (sentence_id1, (start_pos1, end_pos1)) in AB.items():
-            for stmt_id2, (sentence_id2, (start_pos2, end_pos2)) in BC.items():
-                if start_pos1 == start_pos2 or \
-                   (end_pos1 > start_pos2 - neighbor_cutoff) and \
-                   (end_pos1 < start_pos2):
-                    text1 = AB_stmt_jsons[stmt_id1]['evidence'][0]['text']
-                    text2 = BC_stmt_jsons[stmt_id2]['evidence'][0]['text']
-                    rows.append([curie1,
-                                 AB_stmts_type_dict[stmt_id1],
-                                 curie2,
-                                 BC_stmts_type_dict[stmt_id2],
-                                 curie3,
-                                 text1,
-                                 text2,
-                                 sentence_id1,
-                                 sentence_id2,
-                                 reading_id])
-
-    df = pd.DataFrame(rows, columns=['agent1', 'stmt_type1',
-                                     'agent2', 'stmt_type2',
-                                     'agent3', 'text1', 'text2',
-                                     'sentence_id1', 'sentence_id2',
-                                     'reading_id'])
-    return df
+    for i, j in zip(idx1.tolist(), idx2.tolist()):
+        stmt_id1, stmt_id2 = AB_stmt_ids[i], BC_stmt_ids[j]
+        rows.append([curie1,
+                     AB_stmts_type_dict[stmt_id1],
+                     curie2,
+                     BC_stmts_type_dict[stmt_id2],
+                     curie3,
+                     AB_stmt_texts[stmt_id1],
+                     BC_stmt_texts[stmt_id2],
+                     sentence_index.sentence_ids[AB_rows[i]],
+                     sentence_index.sentence_ids[BC_rows[j]],
+                     reading_id])
+    return rows
@@ -0,0 +1,23 @@
+"""Identify the revision of the code that produced benchmark results."""
+
+import os
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_commit():
+    """Return the git commit the package is checked out at
+
+    Returns
+    -------
+    str or None
+        The hash of the commit, or None if the package isn't in a git
+        checkout or git isn't installed.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=HERE,
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,160 @@
+"""Compact indices of the sentence metadata in REACH output jsons."""
+
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ReadingSentenceIndex:
+    """Index of the sentences in a single REACH reading
+
+    Only the information needed to place evidence texts within a reading
+    is kept. Event texts are interned and mapped to rows of arrays holding
+    the sentence ids and the start and end offsets of sentences in the
+    article. Rows are sorted by start offset, so the row number of a
+    sentence is also its ordinal position within the article.
+
+    Parameters
+    ----------
+    sentence_ids : list of str
+        Sentence ids, sorted by start offset.
+    start_positions : numpy.ndarray
+        Start offsets of sentences in the article.
+    end_positions : numpy.ndarray
+        End offsets of sentences in the article.
+    text_to_row : dict
+        Maps the verbose text of each event to the row of the sentence it
+        was extracted from.
+    """
+    __slots__ = ('sentence_ids', 'start_positions', 'end_positions',
+                 'text_to_row')
+
+    def __init__(self, sentence_ids, start_positions, end_positions,
+                 text_to_row):
+        self.sentence_ids = sentence_ids
+        self.start_positions = start_positions
+        self.end_positions = end_positions
+        self.text_to_row = text_to_row
+
+    @classmethod
+    def from_reach_json(cls, reach_json):
+        """Build an index from a reach output json in dict form"""
+        positions = sorted(
+            ((frame['start-pos']['offset'], frame['end-pos']['offset'],
+              frame['frame-id'])
+             for frame in reach_json['sentences']['frames']
+             if 'start-pos' in frame))
+        sentence_ids = [sys.intern(sentence_id)
+                        for _, _, sentence_id in positions]
+        sentence_rows = {sentence_id: row
+                         for row, sentence_id in enumerate(sentence_ids)}
+        start_positions = np.fromiter((start for start, _, _ in positions),
+                                      dtype=np.int64, count=len(positions))
+        end_positions = np.fromiter((end for _, end, _ in positions),
+                                    dtype=np.int64, count=len(positions))
+        # Events from sentences without positions can't be placed in the
+        # article, so they are left out.
+        text_to_row = {}
+        for frame in reach_json['events']['frames']:
+            if 'verbose-text' not in frame:
+                continue
+            row = sentence_rows.get(frame['sentence'])
+            if row is not None:
+                text_to_row[sys.intern(frame['verbose-text'])] = row
+            else:
+                text_to_row.pop(frame['verbose-text'], None)
+        return cls(sentence_ids, start_positions, end_positions, text_to_row)
+
+    def __len__(self):
+        return len(self.sentence_ids)
+
+    def get_row(self, text):
+        """Return the row of the sentence containing an evidence text
+
+        Returns None if the text does not match any event in the reading.
+        """
+        return self.text_to_row.get(text)
+
+    def get_sentence(self, row):
+        """Return a tuple of the form (sentence_id, (start_pos, end_pos))"""
+        return (self.sentence_ids[row],
+                (int(self.start_positions[row]),
+                 int(self.end_positions[row])))
+
+    def match(self, stmt_texts):
+        """Match evidence texts to sentences in the reading
+
+        Parameters
+        ----------
+        stmt_texts : dict
+            A dictionary mapping raw statement ids to evidence texts.
+
+        Returns
+        -------
+        matched : dict
+            A dictionary mapping raw statement ids to rows of the sentence
+            containing their evidence text.
+        unmatched : dict
+            A dictionary mapping raw statement ids to evidence texts that
+            could not be found in the reading.
+        """
+        matched, unmatched = {}, {}
+        for stmt_id, text in stmt_texts.items():
+            row = self.text_to_row.get(text)
+            if row is None:
+                unmatched[stmt_id] = text
+            else:
+                matched[stmt_id] = row
+        return matched, unmatched
+
+
+class SentenceIndexCache:
+    """Thread safe, size bounded LRU cache of sentence indices by reading_id
+
+    Parameters
+    ----------
+    maxsize : Optional[int]
+        Maximum number of sentence indices to hold. Default: 4096
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_many(self, reading_ids):
+        """Return dict of cached indices for those reading_ids present"""
+        results = {}
+        with self._lock:
+            for reading_id in reading_ids:
+                index = self._data.get(reading_id)
+                if index is not None:
+                    self._data.move_to_end(reading_id)
+                    results[reading_id] = index
+                else:
+                    self.misses += 1
+            self.hits += len(results)
+        return results
+
+    def put_many(self, indices):
+        """Add a dict mapping reading_ids to sentence indices to the cache"""
+        with self._lock:
+            for reading_id, index in indices.items():
+                self._data[reading_id] = index
+                self._data.move_to_end(reading_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+#: Cache of sentence indices shared across triples
+SENTENCE_INDEX_CACHE = SentenceIndexCache()
@@ -0,0 +1,239 @@
+"""Deterministic sharding of triple workloads across machines.
+
+Each triple is assigned to one of num_shards shards so that separate
+nodes can each handle a disjoint subset of a triple set. Outputs written
+by the nodes are combined afterwards with
+``python -m causal_precedence_training.sharding DIRECTORY NAME``.
+"""
+
+import glob
+import hashlib
+import heapq
+import os
+import re
+import tarfile
+
+import click
+import pandas as pd
+
+from .query_indra_db import get_pa_statements_for_pairs, \
+    get_reading_counts_for_pa_statements
+
+
+@click.command()
+@click.argument('directory')
+@click.argument('name')
+def main(directory, name):
+    """Merge the shard outputs NAME.shard-*-of-*.csv and
+    NAME_reach_output.shard-*-of-*.tar.gz in DIRECTORY into NAME.csv and
+    NAME_reach_output.tar.gz."""
+    try:
+        csv_paths = find_shard_outputs(directory, name, '.csv')
+        archive_paths = find_shard_outputs(directory, f'{name}_reach_output',
+                                           '.tar.gz')
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    rows = merge_csvs(csv_paths, os.path.join(directory, f'{name}.csv'))
+    readings = merge_tar_archives(
+        archive_paths, os.path.join(directory, f'{name}_reach_output.tar.gz'))
+    click.echo(f'Merged {len(csv_paths)} shards into {rows} rows and'
+               f' {readings} readings')
+
+
+def triple_hash(triple):
+    """Return a hash of a triple of curies that is stable across runs
+
+    Unlike the builtin hash, this doesn't depend on the process, so
+    every node assigns a triple to the same shard.
+    """
+    key = '\t'.join(str(curie) for curie in triple).encode('utf-8')
+    return int.from_bytes(hashlib.sha1(key).digest()[:8], 'big')
+
+
+def get_shard_suffix(shard, num_shards):
+    """Return the suffix added to output file names for a shard"""
+    return f'.shard-{shard}-of-{num_shards}'
+
+
+def get_triple_costs(triples):
+    """Estimate the cost of generating a dataset for each triple
+
+    The cost of a triple is the number of readings supporting its two
+    pairs, or 0 if either pair has no preassembled statements, since
+    reach support is then never looked up. Counts are cheap to get
+    compared with the readings themselves and keep hub genes from
+    skewing shards.
+
+    Parameters
+    ----------
+    triples : iterable of tuple
+        Tuples of the form (curie1, curie2, curie3).
+
+    Returns
+    -------
+    dict
+        dict mapping each triple to its estimated cost.
+    """
+    triples = list(dict.fromkeys(tuple(triple) for triple in triples))
+    pairs = {pair for curie1, curie2, curie3 in triples
+             for pair in ((curie1, curie2), (curie2, curie3))}
+    mk_hash_dicts = get_pa_statements_for_pairs(pairs)
+    counts = get_reading_counts_for_pa_statements(
+        {stmt_mk_hash for mk_hash_dict in mk_hash_dicts.values()
+         for stmt_mk_hash in mk_hash_dict})
+    pair_costs = {pair: sum(counts[stmt_mk_hash]
+                            for stmt_mk_hash in mk_hash_dict)
+                  for pair, mk_hash_dict in mk_hash_dicts.items()}
+    costs = {}
+    for curie1, curie2, curie3 in triples:
+        if mk_hash_dicts[curie1, curie2] and mk_hash_dicts[curie2, curie3]:
+            costs[curie1, curie2, curie3] = \
+                pair_costs[curie1, curie2] + pair_costs[curie2, curie3]
+        else:
+            costs[curie1, curie2, curie3] = 0
+    return costs
+
+
+def assign_shards(triples, num_shards, costs=None):
+    """Assign triples to shards
+
+    Without costs, a triple's shard is its triple_hash modulo num_shards,
+    which doesn't depend on the other triples. With costs, triples are
+    assigned greedily from most to least costly, each to the shard with
+    the least total cost so far. Ties are broken by triple_hash so that
+    every node computing the assignment from the same costs gets the same
+    result. Costs must then come from the same database snapshot on all
+    nodes.
+
+    Parameters
+    ----------
+    triples : iterable of tuple
+        Tuples of the form (curie1, curie2, curie3).
+    num_shards : int
+        Number of shards.
+    costs : Optional[dict]
+        dict mapping triples to estimated costs as returned by
+        get_triple_costs. Triples missing from it have a cost of 0. Each
+        triple also has a fixed cost of 1 for the lookups made regardless
+        of support. Default: None
+
+    Returns
+    -------
+    dict
+        dict mapping each triple to a shard in range(num_shards).
+    """
+    triples = list(dict.fromkeys(tuple(triple) for triple in triples))
+    if costs is None:
+        return {triple: triple_hash(triple) % num_shards
+                for triple in triples}
+    weights = {triple: 1 + costs.get(triple, 0) for triple in triples}
+    triples.sort(key=lambda triple: (-weights[triple], triple_hash(triple)))
+    loads = [(0, shard) for shard in range(num_shards)]
+    shards = {}
+    for triple in triples:
+        load, shard = heapq.heappop(loads)
+        shards[triple] = shard
+        heapq.heappush(loads, (load + weights[triple], shard))
+    return shards
+
+
+def find_shard_outputs(directory, name, extension):
+    """Return paths of the outputs of every shard, in order of shard
+
+    Raises
+    ------
+    ValueError
+        If no outputs are found, outputs come from runs with different
+        numbers of shards, or the output of some shard is missing.
+    """
+    pattern = re.compile(re.escape(name) + r'\.shard-(\d+)-of-(\d+)'
+                         + re.escape(extension) + '$')
+    outputs = {}
+    for path in glob.glob(os.path.join(glob.escape(directory),
+                                       f'{glob.escape(name)}.shard-*'
+                                       f'{extension}')):
+        match = pattern.match(os.path.basename(path))
+        if match:
+            outputs[int(match.group(1)), int(match.group(2))] = path
+    if not outputs:
+        raise ValueError(f'No shard outputs found for {name}{extension}'
+                         f' in {directory}')
+    num_shards = {num_shards for _, num_shards in outputs}
+    if len(num_shards) > 1:
+        raise ValueError(f'Outputs for {name}{extension} come from runs'
+                         f' with different numbers of shards:'
+                         f' {sorted(num_shards)}')
+    num_shards, = num_shards
+    missing = [shard for shard in range(num_shards)
+               if (shard, num_shards) not in outputs]
+    if missing:
+        raise ValueError(f'Missing outputs for {name}{extension} from'
+                         f' shards {missing}')
+    return [outputs[shard, num_shards] for shard in range(num_shards)]
+
+
+def merge_csvs(paths, output_path, chunksize=100000):
+    """Concatenate csv files with the same columns
+
+    Rows are kept as they are, including repeated ones, since shards
+    cover disjoint triples and a triple can legitimately have identical
+    rows. Files are read chunksize rows at a time.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths of the csv files to merge.
+    output_path : str
+        Path of the merged csv file.
+    chunksize : Optional[int]
+        Number of rows to read at a time. Default: 100000
+
+    Returns
+    -------
+    int
+        The number of rows written.
+    """
+    count = 0
+    header = True
+    for path in paths:
+        for chunk in pd.read_csv(path, chunksize=chunksize, dtype=str,
+                                 keep_default_na=False):
+            chunk.to_csv(output_path, index=False,
+                         mode='w' if header else 'a', header=header)
+            header = False
+            count += len(chunk)
+    return count
+
+
+def merge_tar_archives(paths, output_path):
+    """Merge tar.gz archives, keeping the first member with each name
+
+    Members are streamed from each archive into the merged one, so
+    readings shared between shards are only written once.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths of the tar.gz archives to merge.
+    output_path : str
+        Path of the merged tar.gz archive.
+
+    Returns
+    -------
+    int
+        The number of members written.
+    """
+    names = set()
+    with tarfile.open(output_path, 'w:gz') as tar:
+        for path in paths:
+            with tarfile.open(path, 'r|gz') as shard_tar:
+                for member in shard_tar:
+                    if not member.isfile() or member.name in names:
+                        continue
+                    names.add(member.name)
+                    tar.addfile(member, shard_tar.extractfile(member))
+    return len(names)
+
+
+if __name__ == '__main__':
+    main()
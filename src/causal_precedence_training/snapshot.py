@@ -0,0 +1,164 @@
+"""Local SQLite snapshots of the slice of indra_db used by the pipeline.
+
+A snapshot holds the rows of pa_agents, pa_statements, raw_unique_links,
+raw_statements and REACH reading needed to generate datasets for a set of
+pairs of agents. The functions in query_indra_db run against a snapshot
+once it has been selected with use_local_snapshot. Extract one with
+``python -m causal_precedence_training.snapshot``.
+"""
+
+import sqlite3
+
+import click
+import pandas as pd
+
+from .query_indra_db import get_pa_statements_for_pairs, \
+    get_reach_support_for_pa_statements, iter_in_query, set_backend
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS pa_agents'
+    ' (stmt_mk_hash INTEGER NOT NULL, db_name TEXT NOT NULL,'
+    ' db_id TEXT NOT NULL, role TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS pa_agents_curie'
+    ' ON pa_agents (db_name, db_id, role)',
+    'CREATE INDEX IF NOT EXISTS pa_agents_stmt_mk_hash'
+    ' ON pa_agents (stmt_mk_hash)',
+    'CREATE TABLE IF NOT EXISTS pa_statements'
+    ' (mk_hash INTEGER PRIMARY KEY, type TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS raw_unique_links'
+    ' (pa_stmt_mk_hash INTEGER NOT NULL, raw_stmt_id INTEGER NOT NULL,'
+    ' UNIQUE (pa_stmt_mk_hash, raw_stmt_id))',
+    'CREATE TABLE IF NOT EXISTS raw_statements'
+    ' (id INTEGER PRIMARY KEY, reading_id INTEGER, json BLOB NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS raw_statements_reading_id'
+    ' ON raw_statements (reading_id)',
+    'CREATE TABLE IF NOT EXISTS reading'
+    ' (id INTEGER PRIMARY KEY, reader TEXT NOT NULL, bytes BLOB NOT NULL)',
+]
+
+TABLE_COLUMNS = {
+    'pa_agents': ['stmt_mk_hash', 'db_name', 'db_id', 'role'],
+    'pa_statements': ['mk_hash', 'type'],
+    'raw_unique_links': ['pa_stmt_mk_hash', 'raw_stmt_id'],
+    'raw_statements': ['id', 'reading_id', 'json'],
+    'reading': ['id', 'reader', 'bytes'],
+}
+
+
+@click.command()
+@click.argument('triples_path')
+@click.argument('output_path')
+def main(triples_path, output_path):
+    """Extract snapshot for triples in a csv with columns agent1, agent2
+    and agent3 holding curies."""
+    triples_df = pd.read_csv(triples_path, usecols=['agent1', 'agent2',
+                                                     'agent3'])
+    pairs = set()
+    for curie1, curie2, curie3 in triples_df.values:
+        pairs.add((curie1, curie2))
+        pairs.add((curie2, curie3))
+    extract_snapshot(output_path, pairs)
+
+
+def create_snapshot(path):
+    """Create an empty snapshot, or open an existing one
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file.
+
+    Returns
+    -------
+    sqlite3.Connection
+    """
+    connection = sqlite3.connect(path)
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+    return connection
+
+
+def write_snapshot_rows(connection, table, rows):
+    """Insert rows into a table of a snapshot, skipping existing rows
+
+    Parameters
+    ----------
+    connection : sqlite3.Connection
+        Connection to the snapshot as returned by create_snapshot.
+    table : str
+        Name of the table. One of the keys of TABLE_COLUMNS.
+    rows : iterable of tuple
+        Rows with values for the columns in TABLE_COLUMNS[table].
+    """
+    columns = TABLE_COLUMNS[table]
+    placeholders = ', '.join('?' * len(columns))
+    with connection:
+        connection.executemany(
+            f'INSERT OR IGNORE INTO {table} ({", ".join(columns)})'
+            f' VALUES ({placeholders})', rows)
+
+
+def extract_snapshot(path, pairs):
+    """Copy the rows of indra_db needed for pairs of agents into a snapshot
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file. Rows are added to it if it already
+        exists.
+    pairs : iterable of tuple
+        Tuples of the form (curie1, curie2). See
+        query_indra_db.get_pa_statements_for_pairs.
+    """
+    connection = create_snapshot(path)
+    stmt_mk_hashes = {stmt_mk_hash for mk_hash_dict
+                      in get_pa_statements_for_pairs(pairs).values()
+                      for stmt_mk_hash in mk_hash_dict}
+    write_snapshot_rows(
+        connection, 'pa_agents',
+        iter_in_query('SELECT stmt_mk_hash, db_name, db_id, role'
+                      ' FROM pa_agents WHERE stmt_mk_hash IN :stmt_mk_hashes',
+                      'stmt_mk_hashes', stmt_mk_hashes))
+    write_snapshot_rows(
+        connection, 'pa_statements',
+        iter_in_query('SELECT mk_hash, type FROM pa_statements'
+                      ' WHERE mk_hash IN :stmt_mk_hashes',
+                      'stmt_mk_hashes', stmt_mk_hashes))
+    raw_stmt_ids, reading_ids = set(), set()
+    links = []
+    for stmt_mk_hash, raw_stmt_id, reading_id in \
+            get_reach_support_for_pa_statements(stmt_mk_hashes):
+        links.append((stmt_mk_hash, raw_stmt_id))
+        raw_stmt_ids.add(raw_stmt_id)
+        reading_ids.add(reading_id)
+    write_snapshot_rows(connection, 'raw_unique_links', links)
+    write_snapshot_rows(
+        connection, 'raw_statements',
+        ((stmt_id, reading_id, bytes(json_)) for stmt_id, reading_id, json_
+         in iter_in_query('SELECT id, reading_id, json FROM raw_statements'
+                          ' WHERE id IN :stmt_ids', 'stmt_ids',
+                          raw_stmt_ids)))
+    write_snapshot_rows(
+        connection, 'reading',
+        ((reading_id, reader, bytes(bytes_)) for reading_id, reader, bytes_
+         in iter_in_query('SELECT id, reader, bytes FROM reading'
+                          ' WHERE id IN :reading_ids', 'reading_ids',
+                          reading_ids)))
+    connection.close()
+
+
+def use_local_snapshot(path):
+    """Run all queries in query_indra_db against a local snapshot
+
+    Parameters
+    ----------
+    path : str
+        Path to a snapshot created with extract_snapshot or
+        create_snapshot.
+    """
+    set_backend(f'sqlite:///{path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""A versioned, columnar on-disk cache of BEL graphs.
+
+A graph is stored as Parquet tables of its nodes, its edges and the
+transitivities found while parsing, alongside a manifest recording the
+hash of the BEL script it was parsed from and the version of PyBEL that
+parsed it. The cache is only used if both still match. Nodes and edges are
+stored in the order of the graph and edges keep their keys, which the
+transitivities refer to.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, Optional
+
+import pandas as pd
+import pybel
+
+#: Version of the layout of the cache. Bump when it changes.
+GRAPH_CACHE_VERSION = 2
+
+MANIFEST_NAME = 'manifest.json'
+NODES_NAME = 'nodes.parquet'
+EDGES_NAME = 'edges.parquet'
+TRANSITIVITIES_NAME = 'transitivities.parquet'
+
+
+def get_file_sha256(path: str) -> str:
+    """Get the SHA-256 hex digest of a file, read a chunk at a time."""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(2 ** 20), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def get_manifest(source_path: str) -> Dict[str, Any]:
+    """Get the manifest a cached graph parsed from the given BEL script must match."""
+    return {
+        'cache_version': GRAPH_CACHE_VERSION,
+        'source_sha256': get_file_sha256(source_path),
+        'pybel_version': pybel.get_version(),
+    }
+
+
+def read_graph_cache(directory: str, manifest: Dict[str, Any]) -> Optional[pybel.BELGraph]:
+    """Load a graph from the cache, or return None if it is missing or stale.
+
+    :param directory: The directory of the cached graph
+    :param manifest: The manifest the cached graph must match, from :func:`get_manifest`
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as file:
+            cached_manifest = json.load(file)
+    except FileNotFoundError:
+        return None
+    if any(cached_manifest.get(key) != value for key, value in manifest.items()):
+        return None
+
+    nodes_df = pd.read_parquet(os.path.join(directory, NODES_NAME), memory_map=True)
+    edges_df = pd.read_parquet(os.path.join(directory, EDGES_NAME), memory_map=True)
+    transitivities_df = pd.read_parquet(os.path.join(directory, TRANSITIVITIES_NAME), memory_map=True)
+    graph = _from_tables(cached_manifest['graph'], nodes_df, edges_df)
+    graph.transitivities = set(transitivities_df[['key1', 'key2']].itertuples(index=False, name=None))
+    return graph
+
+
+def _from_tables(graph_dict: Dict[str, Any], nodes_df: pd.DataFrame, edges_df: pd.DataFrame) -> pybel.BELGraph:
+    # Mirrors how pybel.from_nodelink restores nodes and edge data, except that
+    # edges keep their stored keys. It would hash the normalized data again,
+    # which changes the keys of edges with modifiers. Nodes are added without
+    # the edges to their members and variants, which are stored in order with
+    # the other edges.
+    from pybel.constants import ANNOTATIONS, CITATION, SOURCE_MODIFIER, TARGET_MODIFIER
+    from pybel.io.nodelink import _handle_modifier, _recover_graph_dict
+    from pybel.language import citation_dict
+    from pybel.tokens import parse_result_to_dsl
+
+    graph = pybel.BELGraph()
+    graph.graph = graph_dict
+    _recover_graph_dict(graph)
+    nodes = [parse_result_to_dsl(json.loads(node)) for node in nodes_df['node']]
+    graph.add_nodes_from(nodes)
+    for source, target, key, data in edges_df[['source', 'target', 'key', 'data']].values:
+        data = json.loads(data)
+        for side in (SOURCE_MODIFIER, TARGET_MODIFIER):
+            if data.get(side):
+                _handle_modifier(data[side])
+        if CITATION in data:
+            data[CITATION] = citation_dict(**data[CITATION])
+        if ANNOTATIONS in data:
+            data[ANNOTATIONS] = graph._clean_annotations(data[ANNOTATIONS])
+        graph.add_edge(nodes[source], nodes[target], key=key, **data)
+    return graph
+
+
+def write_graph_cache(graph: pybel.BELGraph, directory: str, manifest: Dict[str, Any]) -> None:
+    """Write a graph to the cache, replacing whatever was there.
+
+    :param graph: The graph to cache
+    :param directory: The directory of the cached graph
+    :param manifest: The manifest of the graph, from :func:`get_manifest`
+    """
+    nodelink = pybel.to_nodelink(graph)
+    # The node-link format sorts nodes, so they are written in the order of
+    # the graph instead, and links, which follow the order of the edges, are
+    # pointed at them
+    index = {node: i for i, node in enumerate(graph)}
+    nodes_df = pd.DataFrame({'node': [json.dumps(node) for node in graph]})
+    edges_df = pd.DataFrame(
+        [
+            (index[u], index[v], key, json.dumps({name: value for name, value in link.items() if name not in {'source', 'target', 'key'}}))
+            for (u, v, key), link in zip(graph.edges(keys=True), nodelink['links'])
+        ],
+        columns=['source', 'target', 'key', 'data'],
+    )
+    transitivities_df = pd.DataFrame(sorted(graph.transitivities), columns=['key1', 'key2'])
+
+    # Write into a temporary directory first so a failure never leaves a
+    # cache whose manifest doesn't match its tables
+    parent = os.path.dirname(os.path.abspath(directory))
+    temp_directory = tempfile.mkdtemp(dir=parent)
+    try:
+        nodes_df.to_parquet(os.path.join(temp_directory, NODES_NAME), index=False)
+        edges_df.to_parquet(os.path.join(temp_directory, EDGES_NAME), index=False)
+        transitivities_df.to_parquet(os.path.join(temp_directory, TRANSITIVITIES_NAME), index=False)
+        with open(os.path.join(temp_directory, MANIFEST_NAME), 'w') as file:
+            json.dump({**manifest, 'graph': nodelink['graph']}, file, indent=2)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(temp_directory, directory)
+    finally:
+        if os.path.exists(temp_directory):
+            shutil.rmtree(temp_directory)
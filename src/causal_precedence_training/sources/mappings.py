@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""Lazily loaded mapping resources used to ground BEL content.
+
+Nothing is loaded when this module is imported. Each resource is built from
+its source (FamPlex, PyOBO, or the Bioregistry) the first time it is needed,
+then stored in a compact form in the ``causal_precedence_training/mappings``
+PyStow directory and kept in memory, so later runs only read the compact form
+and never import the libraries the resource was built with.
+"""
+
+import json
+import logging
+import shutil
+from functools import lru_cache
+from typing import Dict, Mapping, Optional
+
+import pandas as pd
+import pystow
+
+logger = logging.getLogger(__name__)
+
+module = pystow.module('causal_precedence_training', 'mappings')
+
+FAMPLEX_BEL_NAME = 'famplex_bel.json'
+PREFIXES_NAME = 'prefixes.json'
+NAME_ID_DIRECTORY = 'name_id'
+
+
+@lru_cache(maxsize=1)
+def get_famplex_bel_mapping() -> Mapping[str, str]:
+    """Get a dictionary from BEL family and complex names to FamPlex identifiers."""
+    path = module.join(name=FAMPLEX_BEL_NAME)
+    if path.exists():
+        return json.loads(path.read_text())
+
+    from pyobo.xrefdb.sources.famplex import _get_famplex_df
+
+    fplx_df = _get_famplex_df()
+    rv = dict(fplx_df.loc[fplx_df['target_ns'] == 'BEL', ['target_id', 'source_id']].values)
+    _write_json(path, rv)
+    return rv
+
+
+@lru_cache(maxsize=1)
+def _get_prefixes() -> Dict[str, Optional[str]]:
+    path = module.join(name=PREFIXES_NAME)
+    if path.exists():
+        return json.loads(path.read_text())
+    return {}
+
+
+def normalize_prefix(namespace: str) -> Optional[str]:
+    """Normalize a namespace with the Bioregistry, remembering the result on disk.
+
+    :param namespace: A BEL namespace
+    :returns: The normalized prefix, or None if the Bioregistry can't normalize it
+    """
+    prefixes = _get_prefixes()
+    if namespace in prefixes:
+        return prefixes[namespace]
+
+    import bioregistry
+
+    prefixes[namespace] = bioregistry.normalize_prefix(namespace)
+    _write_json(module.join(name=PREFIXES_NAME), prefixes)
+    return prefixes[namespace]
+
+
+@lru_cache(maxsize=None)
+def get_name_id_mapping(prefix: str) -> Mapping[str, str]:
+    """Get a dictionary from names to identifiers for a normalized prefix with PyOBO.
+
+    :param prefix: A prefix normalized with :func:`normalize_prefix`
+    :returns: The mapping, which is stored as a two column Parquet table
+    :raises Exception: Anything :func:`pyobo.get_name_id_mapping` raises if the
+        mapping isn't stored yet and PyOBO can't get it. Failures aren't stored.
+    """
+    path = module.join(NAME_ID_DIRECTORY, name=f'{prefix}.parquet')
+    if path.exists():
+        df = pd.read_parquet(path)
+        return dict(zip(df['name'], df['identifier']))
+
+    import pyobo
+
+    rv = pyobo.get_name_id_mapping(prefix) or {}
+    pd.DataFrame(list(rv.items()), columns=['name', 'identifier'], dtype=str).to_parquet(path, index=False)
+    return rv
+
+
+def clear_mappings() -> None:
+    """Remove all stored mapping resources, both on disk and in memory."""
+    shutil.rmtree(module.base, ignore_errors=True)
+    module.base.mkdir(parents=True, exist_ok=True)
+    get_famplex_bel_mapping.cache_clear()
+    _get_prefixes.cache_clear()
+    get_name_id_mapping.cache_clear()
+
+
+def _write_json(path, obj) -> None:
+    # Write to a temporary file first so a failure never leaves a truncated resource
+    temp_path = path.with_name(f'{path.name}.tmp')
+    temp_path.write_text(json.dumps(obj, sort_keys=True))
+    temp_path.replace(path)
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""Parse BEL scripts in parallel.
+
+The statements section of a BEL script is split into chunks at ``SET Citation``
+and ``SET STATEMENT_GROUP`` lines. Each chunk is parsed in a worker process
+together with the document header and definitions, starting from the ``SET``
+state (citation, evidence, annotations, and statement group) that was active
+where the chunk begins. The state is found with PyBEL's own control parser in a
+pass over only the ``SET`` and ``UNSET`` lines, so it is exactly what a serial
+parse would have at that line. The chunks' graphs are then merged in order,
+which gives the same nodes, edges, transitivities, and warnings, in the same
+order, as :func:`pybel.from_bel_script`.
+"""
+
+import copy
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Executor
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pybel
+    from pybel.parser import BELParser, MetadataParser
+    from pybel.parser.parse_control import ControlParser
+
+__all__ = [
+    'from_bel_script_parallel',
+]
+
+logger = logging.getLogger(__name__)
+
+EnumLines = Tuple[Tuple[int, str], ...]
+ControlState = Tuple[Any, ...]
+
+#: Lines of the statements section a chunk can start at
+BOUNDARY_RE = re.compile(r'SET\s+(Citation|STATEMENT_GROUP)\b')
+#: Lines of the statements section that change the control parser's state
+CONTROL_RE = re.compile(r'(UN)?SET\s')
+
+#: Serializes building parsers in this process. PyBEL's cache database can't
+#: be created by several threads at once, and parsers share parts of their
+#: grammar, so only the parser built last handles every control statement.
+_PARSER_LOCK = threading.Lock()
+
+#: Keyword arguments of :func:`pybel.io.line_utils.parse_lines` used to parse the definitions
+METADATA_OPTIONS = {'allow_redefinition', 'no_identifier_validation', 'upgrade_urls', 'allow_definition_failures'}
+#: Keyword arguments of :func:`pybel.io.line_utils.parse_lines` used to parse the statements
+PARSER_OPTIONS = {
+    'disallow_nested', 'citation_clearing', 'no_identifier_validation', 'allow_naked_names',
+    'disallow_unqualified_translocations', 'required_annotations',
+}
+
+
+def from_bel_script_parallel(
+    path: str,
+    executor: Executor,
+    n_chunks: Optional[int] = None,
+    **kwargs,
+) -> 'pybel.BELGraph':
+    """Parse a BEL script into a graph, parsing chunks of its statements in a process pool.
+
+    :param path: The path to a BEL script
+    :param executor: A process pool to parse chunks in. It can be shared by several calls at once.
+    :param n_chunks: The approximate number of chunks to split the statements into. Defaults
+        to four times the number of CPUs, so that workers stay busy when chunks take unequal time.
+    :param kwargs: Keyword arguments of :func:`pybel.io.line_utils.parse_lines` in
+        :data:`METADATA_OPTIONS` or :data:`PARSER_OPTIONS`
+    :returns: A graph identical to the one :func:`pybel.from_bel_script` gives for the same arguments
+    """
+    import pybel
+    from bel_resources import split_file_to_annotations_and_definitions
+
+    unknown = set(kwargs) - METADATA_OPTIONS - PARSER_OPTIONS
+    if unknown:
+        raise TypeError(f'unsupported keyword arguments: {", ".join(sorted(unknown))}')
+    metadata_options = {key: value for key, value in kwargs.items() if key in METADATA_OPTIONS}
+    parser_options = {key: value for key, value in kwargs.items() if key in PARSER_OPTIONS}
+
+    path = os.fspath(path)
+    with open(path) as file:
+        # The sections are generators over the same lines, so they have to be consumed in order
+        docs, definitions, statements = (tuple(section) for section in split_file_to_annotations_and_definitions(file))
+
+    graph = pybel.BELGraph(path=path)
+    if n_chunks is None:
+        n_chunks = 4 * (os.cpu_count() or 1)
+    chunk_size = max(1, -(-len(statements) // n_chunks))
+    with _PARSER_LOCK:
+        # Definitions are parsed here first so that every resource they need
+        # is already in PyBEL's cache when workers parse them again
+        metadata_parser = _parse_header(graph, docs, definitions, **metadata_options)
+        bel_parser = _get_bel_parser(graph, metadata_parser, **parser_options)
+        # Chunks of one script are all queued before those of another, so
+        # workers rarely switch between scripts
+        futures = [
+            executor.submit(_parse_chunk, path, docs, definitions, chunk, state, metadata_options, parser_options)
+            for state, chunk in iter_chunks(statements, bel_parser.control_parser, chunk_size)
+        ]
+    for future in futures:
+        _merge_graph(graph, future.result())
+
+    logger.info('Network has %d nodes and %d edges', graph.number_of_nodes(), graph.number_of_edges())
+    return graph
+
+
+def iter_chunks(
+    statements: Iterable[Tuple[int, str]],
+    control_parser: 'ControlParser',
+    chunk_size: int,
+) -> Iterable[Tuple[ControlState, List[Tuple[int, str]]]]:
+    """Split the statements section of a BEL script into chunks that can be parsed independently.
+
+    :param statements: Pairs of line numbers and lines of the statements section
+    :param control_parser: The control parser of a BEL parser that has parsed the definitions.
+        It is left in the state at the end of the statements.
+    :param chunk_size: The number of lines after which a chunk ends at the next boundary
+    :yields: Pairs of the control parser's state where a chunk starts and the chunk's lines
+    """
+    state, chunk = _get_control_state(control_parser), []
+    for line_number, line in statements:
+        if len(chunk) >= chunk_size and BOUNDARY_RE.match(line):
+            yield state, chunk
+            state, chunk = _get_control_state(control_parser), []
+        chunk.append((line_number, line))
+        if CONTROL_RE.match(line):
+            try:
+                control_parser.parseString(line, line_number=line_number)
+            except Exception:  # the worker parsing the line reports it
+                pass
+    if chunk:
+        yield state, chunk
+
+
+def _parse_chunk(
+    path: str,
+    docs: EnumLines,
+    definitions: EnumLines,
+    statements: List[Tuple[int, str]],
+    state: ControlState,
+    metadata_options: Dict[str, Any],
+    parser_options: Dict[str, Any],
+) -> 'pybel.BELGraph':
+    import pybel
+    from pybel.io.line_utils import parse_statements
+
+    header_graph, bel_parser = _get_worker_parser(
+        path, docs, definitions, _freeze(metadata_options), _freeze(parser_options),
+    )
+    # Each chunk gets its own graph, which needs the metadata from the
+    # header, such as the values of annotations, to add edges
+    graph = pybel.BELGraph()
+    graph.graph = copy.deepcopy(header_graph.graph)
+    bel_parser.graph = graph
+    _set_control_state(bel_parser.control_parser, state)
+    parse_statements(graph, statements, bel_parser, use_tqdm=False)
+    return graph
+
+
+@lru_cache(maxsize=1)
+def _get_worker_parser(
+    path: str,
+    docs: EnumLines,
+    definitions: EnumLines,
+    metadata_options: Tuple[Tuple[str, Any], ...],
+    parser_options: Tuple[Tuple[str, Any], ...],
+) -> Tuple['pybel.BELGraph', 'BELParser']:
+    # Each worker parses the header of a script, loads the resources it
+    # defines and builds a parser once rather than once per chunk, which
+    # would also leak memory in pyparsing. Only the last parser is kept since
+    # it is the only one that handles every control statement.
+    import pybel
+
+    graph = pybel.BELGraph(path=path)
+    metadata_parser = _parse_header(graph, docs, definitions, **dict(metadata_options))
+    return graph, _get_bel_parser(graph, metadata_parser, **dict(parser_options))
+
+
+def _freeze(options: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(sorted(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in options.items()
+    ))
+
+
+def _parse_header(
+    graph: 'pybel.BELGraph',
+    docs: EnumLines,
+    definitions: EnumLines,
+    allow_redefinition: bool = False,
+    no_identifier_validation: bool = False,
+    upgrade_urls: bool = False,
+    allow_definition_failures: bool = False,
+) -> 'MetadataParser':
+    # Mirrors how pybel.io.line_utils.parse_lines parses the document and definitions sections
+    from pybel.io.line_utils import parse_document, parse_definitions
+    from pybel.manager import Manager
+    from pybel.parser import MetadataParser
+
+    metadata_parser = MetadataParser(
+        Manager(),
+        allow_redefinition=allow_redefinition,
+        skip_validation=no_identifier_validation,
+        upgrade_urls=upgrade_urls,
+    )
+    parse_document(graph, docs, metadata_parser)
+    parse_definitions(graph, definitions, metadata_parser, allow_failures=allow_definition_failures)
+    return metadata_parser
+
+
+def _get_bel_parser(
+    graph: 'pybel.BELGraph',
+    metadata_parser: 'MetadataParser',
+    disallow_nested: bool = False,
+    citation_clearing: bool = True,
+    no_identifier_validation: bool = False,
+    allow_naked_names: bool = False,
+    disallow_unqualified_translocations: bool = False,
+    required_annotations: Optional[List[str]] = None,
+) -> 'BELParser':
+    # Mirrors the BEL parser that pybel.io.line_utils.parse_lines builds
+    from pybel.parser import BELParser
+
+    return BELParser(
+        graph=graph,
+        namespace_to_term_to_encoding=metadata_parser.namespace_to_term_to_encoding,
+        namespace_to_pattern=metadata_parser.namespace_to_pattern,
+        annotation_to_term=metadata_parser.annotation_to_term,
+        annotation_to_pattern=metadata_parser.annotation_to_pattern,
+        annotation_to_local=metadata_parser.annotation_to_local,
+        disallow_nested=disallow_nested,
+        citation_clearing=citation_clearing,
+        skip_validation=no_identifier_validation,
+        allow_naked_names=allow_naked_names,
+        disallow_unqualified_translocations=disallow_unqualified_translocations,
+        required_annotations=required_annotations,
+    )
+
+
+def _get_control_state(control_parser: 'ControlParser') -> ControlState:
+    return copy.deepcopy((
+        control_parser.statement_group,
+        control_parser.citation_db,
+        control_parser.citation_db_id,
+        control_parser.evidence,
+        control_parser.annotations,
+    ))
+
+
+def _set_control_state(control_parser: 'ControlParser', state: ControlState) -> None:
+    (
+        control_parser.statement_group,
+        control_parser.citation_db,
+        control_parser.citation_db_id,
+        control_parser.evidence,
+        control_parser.annotations,
+    ) = state
+
+
+def _merge_graph(graph: 'pybel.BELGraph', chunk_graph: 'pybel.BELGraph') -> None:
+    # Chunks are merged in order, so everything is added in the order of its
+    # first appearance in the script, just like in a serial parse
+    graph.add_nodes_from(chunk_graph.nodes(data=True))
+    graph.add_edges_from(chunk_graph.edges(keys=True, data=True))
+    graph.transitivities.update(chunk_graph.transitivities)
+    graph.warnings.extend(chunk_graph.warnings)
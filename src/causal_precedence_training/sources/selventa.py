@@ -6,134 +6,219 @@ Run with ``python -m causal_precedence_training.sources.selventa``.
 """
 
 import logging
+import multiprocessing
 import os
-from typing import Tuple, Union
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Dict, Iterable, Mapping, Optional, TYPE_CHECKING, Tuple, Union
 
-import bioregistry
 import click
 import pandas as pd
-import pybel
-import pybel.constants as pc
-import pyobo
 import pystow
 from more_click import verbose_option
-from pybel.dsl import BaseConcept
-from pyobo.xrefdb.sources.famplex import _get_famplex_df
 from tqdm.autonotebook import tqdm
 
 from causal_precedence_training.resources import HERE
+from causal_precedence_training.sources import mappings
+
+if TYPE_CHECKING:
+    import pybel
 
 logger = logging.getLogger(__name__)
 
 module = pystow.module('causal_precedence_training', 'selventa')
 
-fplx_df = _get_famplex_df()
-bel_fplx = dict(fplx_df.loc[fplx_df['target_ns'] == 'BEL', ['target_id', 'source_id']].values)
+GRAPH_NAMES = ['large_corpus', 'small_corpus']
 
 
 @click.command()
 @verbose_option
 @click.option('--force', is_flag=True)
-def main(force: bool):
-    for graph_name in 'large_corpus', 'small_corpus':
+@click.option('--workers', type=int, help='Number of processes to parse BEL in. Defaults to the number of CPUs.')
+def main(force: bool, workers: Optional[int]):
+    # Both corpora are parsed at once in one pool of processes. Its workers
+    # are spawned rather than forked since the corpora are handled in threads.
+    # PyBEL can't parse serially in several threads of a process at once.
+    executor = None
+    if workers != 1:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    n_threads = 1 if executor is None else len(GRAPH_NAMES)
+    with executor or nullcontext(), ThreadPoolExecutor(n_threads) as threads:
+        dfs = list(threads.map(
+            lambda graph_name: get_dataframe(graph_name=graph_name, force=force, executor=executor),
+            GRAPH_NAMES,
+        ))
+    if force:
+        # Cleared once here rather than for each corpus, which would throw
+        # away the groundings of the corpora before it
+        clear_groundings()
+    for graph_name, df in zip(GRAPH_NAMES, dfs):
         click.secho(f'{graph_name} results:', fg='blue')
-        df = get_normalized_dataframe(graph_name=graph_name, force=force)
+        df = normalize_dataframe(df, graph_name=graph_name)
         click.echo(df.head())
 
 
-def get_normalized_dataframe(graph_name: str, force: bool = False) -> pd.DataFrame:
-    df = get_dataframe(graph_name=graph_name, force=force)
+def get_normalized_dataframe(graph_name: str, force: bool = False, executor: Optional[Executor] = None) -> pd.DataFrame:
+    df = get_dataframe(graph_name=graph_name, force=force, executor=executor)
+    return normalize_dataframe(df, graph_name=graph_name, force=force)
+
 
+def normalize_dataframe(df: pd.DataFrame, graph_name: str, force: bool = False) -> pd.DataFrame:
+    """Ground the entities of a dataframe from :func:`get_dataframe` and write it to the resources."""
+    keys = {
+        (namespace, name)
+        for letter in 'abc'
+        for namespace, name in df[[f'{letter}.prefix', f'{letter}.name']].values
+    }
+    groundings_df = get_groundings(keys, force=force)
     for letter in 'abc':
-        df[[f'{letter}.prefix', f'{letter}.identifier', f'{letter}.name']] = [
-            get_identifier(namespace, name)
-            for namespace, name in df[[f'{letter}.prefix', f'{letter}.name']].values
-        ]
+        # A left merge keeps the rows of df in order
+        merged = df[[f'{letter}.prefix', f'{letter}.name']].merge(
+            groundings_df,
+            how='left',
+            left_on=[f'{letter}.prefix', f'{letter}.name'],
+            right_on=['namespace', 'name'],
+        )
+        df[f'{letter}.prefix'] = merged['prefix'].values
+        df[f'{letter}.identifier'] = merged['identifier'].values
+        df[f'{letter}.name'] = merged['grounded_name'].values
     output_path = os.path.join(HERE, f'selventa_{graph_name}.tsv')
     df.to_csv(output_path, sep='\t', index=False)
     return df
 
 
+#: Columns of the persistent grounding table
+GROUNDING_COLUMNS = ['namespace', 'name', 'prefix', 'identifier', 'grounded_name']
+
 MISSING_NAMESPACE = set()
+#: Namespaces whose mapping couldn't be loaded in this run. Their groundings
+#: aren't written to the table so that they are tried again in the next run.
+FAILED_NAMESPACE = set()
 MISSING = set()
 
 
+def get_groundings(keys: Iterable[Tuple[str, str]], force: bool = False) -> pd.DataFrame:
+    """Get groundings for (namespace, name) keys from the persistent grounding table.
+
+    Keys not yet in the table are grounded with :func:`ground_keys` and added
+    to it, so groundings are reused across corpora and runs. Keys of namespaces
+    in :data:`FAILED_NAMESPACE` are returned but not added.
+
+    :param keys: Pairs of BEL namespaces and names
+    :param force: If true, discard the table with :func:`clear_groundings` and ground every key again
+    :returns: A dataframe with columns :data:`GROUNDING_COLUMNS` with one row
+        for each key in the table, including the given ones
+    """
+    path = module.join(name='groundings.parquet')
+    if force:
+        clear_groundings()
+    if path.exists():
+        groundings_df = pd.read_parquet(path)
+    else:
+        groundings_df = pd.DataFrame(columns=GROUNDING_COLUMNS, dtype=object)
+    known = set(zip(groundings_df['namespace'], groundings_df['name']))
+    missing = [key for key in keys if key not in known]
+    if not missing and path.exists():
+        return groundings_df
+    new_df = pd.DataFrame(
+        [(namespace, name, *grounding) for (namespace, name), grounding in ground_keys(missing).items()],
+        columns=GROUNDING_COLUMNS,
+        dtype=object,
+    )
+    failed = new_df['prefix'].isin(FAILED_NAMESPACE)
+    pd.concat([groundings_df, new_df[~failed]], ignore_index=True).to_parquet(path, index=False)
+    return pd.concat([groundings_df, new_df], ignore_index=True)
+
+
+def clear_groundings() -> None:
+    """Remove the persistent grounding table and the mapping resources it was built from."""
+    path = module.join(name='groundings.parquet')
+    if path.exists():
+        path.unlink()
+    mappings.clear_mappings()
+    MISSING_NAMESPACE.clear()
+    FAILED_NAMESPACE.clear()
+    MISSING.clear()
+
+
+def ground_keys(keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[str, Optional[str], str]]:
+    """Ground (namespace, name) keys, resolving each namespace once.
+
+    :param keys: Pairs of BEL namespaces and names
+    :returns: A dictionary from each unique key to the triple of prefix,
+        identifier, and name that :func:`get_identifier` would give for it
+    """
+    names_by_namespace = defaultdict(set)
+    for namespace, name in keys:
+        names_by_namespace[namespace].add(name)
+    rv = {}
+    for namespace, names in names_by_namespace.items():
+        for name, grounding in _ground_namespace(namespace, names).items():
+            rv[namespace, name] = grounding
+    return rv
+
+
 def get_identifier(namespace: str, name: str) -> Union[Tuple[str, None, str], Tuple[str, str, str]]:
+    return ground_keys([(namespace, name)])[namespace, name]
+
+
+def _ground_namespace(namespace: str, names: Iterable[str]) -> Dict[str, Tuple[str, Optional[str], str]]:
     if namespace in {'SFAM', 'SCOMP'}:
-        return 'fplx', bel_fplx.get(name), name
+        bel_fplx = mappings.get_famplex_bel_mapping()
+        return {name: ('fplx', bel_fplx.get(name), name) for name in names}
     if namespace in {'SCHEM', 'CHEBI'}:
-        prefix, identifier, name = pyobo.ground('chebi', name)
-        return prefix or namespace, identifier, name
+        import pyobo
 
-    norm_namespace = bioregistry.normalize_prefix(namespace)
+        rv = {}
+        for name in names:
+            prefix, identifier, chebi_name = pyobo.ground('chebi', name)
+            rv[name] = prefix or namespace, identifier, chebi_name
+        return rv
+
+    norm_namespace = mappings.normalize_prefix(namespace)
     if norm_namespace is None:
         raise ValueError(f'could not normalize {namespace}')
     namespace = norm_namespace
 
+    name_id_mapping = _get_name_id_mapping(namespace)
+    if not name_id_mapping:
+        return {name: (namespace, None, name) for name in names}
+
+    rv = {}
+    for name in names:
+        identifier = name_id_mapping.get(name)
+        if not identifier and (namespace, name) not in MISSING:
+            MISSING.add((namespace, name))
+            logger.debug('missing lookup for %s ! %s', namespace, name)
+        rv[name] = namespace, identifier or None, name
+    return rv
+
+
+def _get_name_id_mapping(namespace: str) -> Optional[Mapping[str, str]]:
     if namespace in MISSING_NAMESPACE:
-        return namespace, None, name
+        return None
     try:
-        name_id_mapping = pyobo.get_name_id_mapping(namespace)
+        name_id_mapping = mappings.get_name_id_mapping(namespace)
     except:
         logger.info('missing namespace: %s', namespace)
         MISSING_NAMESPACE.add(namespace)
-        return namespace, None, name
-
-    if name_id_mapping:
-        identifier = name_id_mapping.get(name)
-        if identifier:
-            return namespace, identifier, name
-        elif (namespace, name) not in MISSING:
-            MISSING.add((namespace, name))
-            logger.debug('missing lookup for %s ! %s', namespace, name)
-            return namespace, None, name
-    elif namespace not in MISSING_NAMESPACE:
+        FAILED_NAMESPACE.add(namespace)
+        return None
+    if not name_id_mapping:
         logger.info('empty namespace: %s', namespace)
         MISSING_NAMESPACE.add(namespace)
-
-    return namespace, None, name
+        return None
+    return name_id_mapping
 
 
-def get_dataframe(graph_name: str, force: bool = False) -> pd.DataFrame:
+def get_dataframe(graph_name: str, force: bool = False, executor: Optional[Executor] = None) -> pd.DataFrame:
     cache_path = module.join(name=f'{graph_name}.tsv')
     if cache_path.exists() and not force:
         return pd.read_csv(cache_path, sep='\t')
 
-    graph = get_graph(graph_name=graph_name, force=force)
-
-    key_to_edge = {
-        k: (u, v, d)
-        for u, v, k, d in tqdm(graph.edges(keys=True, data=True))
-    }
-
-    len(graph.transitivities)
-
-    rows = []
-    for k1, k2 in tqdm(graph.transitivities):
-        a, b, data = key_to_edge[k1]
-        _b, c, _ = key_to_edge[k2]
-
-        citation = data.get(pc.CITATION)
-        if not citation or citation.namespace != 'pubmed':
-            continue
-
-        evidence = data.get(pc.EVIDENCE)
-        if not evidence:
-            continue
-
-        if not (isinstance(a, BaseConcept) and isinstance(b, BaseConcept) and isinstance(c, BaseConcept)):
-            continue
-
-        rows.append((
-            a.namespace,  # u1.identifier,
-            a.name,
-            b.namespace,  # v1.identifier,
-            b.name,
-            c.namespace,  # v2.identifier,
-            c.name,
-            citation.identifier,
-            evidence,
-        ))
+    graph = get_graph(graph_name=graph_name, force=force, executor=executor)
+    rows = iter_transitive_rows(graph)
 
     df = pd.DataFrame(rows, columns=[
         'a.prefix',  # 'a.identifier',
@@ -149,15 +234,77 @@ def get_dataframe(graph_name: str, force: bool = False) -> pd.DataFrame:
     return df
 
 
-def get_graph(graph_name: str, force: bool = False) -> pybel.BELGraph:
-    """Get the Selventa large corpus as a BEL Graph."""
+def iter_transitive_rows(graph: 'pybel.BELGraph') -> Iterable[Tuple[str, str, str, str, str, str, str, str]]:
+    """Iterate over rows for transitivities A -> B -> C with a PubMed citation and evidence.
+
+    Edges are filtered before any transitivities are visited. A single pass
+    over the edges builds a compact index from edge keys to only those
+    edges that can take part in a qualifying transitivity: first edges
+    between concepts with a PubMed citation and evidence, and second edges
+    ending in a concept. Rows are then generated lazily from the index.
+
+    :param graph: A BEL graph whose transitivities were recorded during parsing
+    :yields: Tuples of the prefix and name of A, B and C, the PubMed identifier, and
+        the evidence text of the A -> B edge
+    """
+    import pybel.constants as pc
+    from pybel.dsl import BaseConcept
+
+    first_keys = {k1 for k1, _ in graph.transitivities}
+    second_keys = {k2 for _, k2 in graph.transitivities}
+
+    first_edges = {}
+    second_targets = {}
+    for u, v, k, data in tqdm(graph.edges(keys=True, data=True), total=graph.number_of_edges(), desc='edges'):
+        if k in first_keys and isinstance(u, BaseConcept) and isinstance(v, BaseConcept):
+            citation = data.get(pc.CITATION)
+            evidence = data.get(pc.EVIDENCE)
+            if citation and citation.namespace == 'pubmed' and evidence:
+                first_edges[k] = (u.namespace, u.name, v.namespace, v.name, citation.identifier, evidence)
+        if k in second_keys and isinstance(v, BaseConcept):
+            second_targets[k] = (v.namespace, v.name)
+
+    for k1, k2 in graph.transitivities:
+        first_edge = first_edges.get(k1)
+        if first_edge is None:
+            continue
+        second_target = second_targets.get(k2)
+        if second_target is None:
+            continue
+        a_prefix, a_name, b_prefix, b_name, pmid, evidence = first_edge
+        yield a_prefix, a_name, b_prefix, b_name, *second_target, pmid, evidence
+
+
+def get_graph(graph_name: str, force: bool = False, executor: Optional[Executor] = None) -> 'pybel.BELGraph':
+    """Get the Selventa large corpus as a BEL Graph.
+
+    The parsed graph is cached and reused for as long as the BEL script and
+    the version of PyBEL are unchanged.
+
+    :param graph_name: The name of the corpus
+    :param force: If true, download and parse the BEL script again
+    :param executor: A process pool to parse the BEL script in with
+        :func:`from_bel_script_parallel`. If not given, it is parsed serially.
+    """
+    import pybel
+
+    from causal_precedence_training.sources.graph_cache import get_manifest, read_graph_cache, write_graph_cache
+    from causal_precedence_training.sources.parallel_bel import from_bel_script_parallel
+
     url = f'https://github.com/cthoyt/selventa-knowledge/raw/master/selventa_knowledge/{graph_name}.bel'
-    cache_path = module.join(name=f'{graph_name}.bel.pickle')
-    if cache_path.exists() and not force:
-        return pybel.load(cache_path)
     path = module.ensure(url=url, force=force)
-    graph = pybel.from_bel_script(path, citation_clearing=False)
-    pybel.dump(graph, path.as_posix())
+    cache_directory = module.join('graph_cache', name=graph_name).as_posix()
+    manifest = get_manifest(path.as_posix())
+    if not force:
+        graph = read_graph_cache(cache_directory, manifest)
+        if graph is not None:
+            return graph
+        logger.info('parsing %s since it has no up to date cache', path)
+    if executor is None:
+        graph = pybel.from_bel_script(path, citation_clearing=False)
+    else:
+        graph = from_bel_script_parallel(path, executor, citation_clearing=False)
+    write_graph_cache(graph, cache_directory, manifest)
     return graph
 
 
@@ -0,0 +1,129 @@
+"""Benchmark the time it takes to import the package and start its CLIs.
+
+Run with ``python -m causal_precedence_training.startup_benchmark``. Each
+command is timed in a fresh interpreter, and results are written as json so
+that runs from different commits can be compared. Heavy libraries that
+should only be imported when they are used are reported for each import, so
+a regression shows up even when timings are noisy.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import click
+
+from .revision import get_commit
+
+#: Names and interpreter arguments of the commands that are timed
+COMMANDS = {
+    'import_package': ['-c', 'import causal_precedence_training'],
+    'import_selventa': ['-c',
+                        'import causal_precedence_training.sources.selventa'],
+    'selventa_help': ['-m', 'causal_precedence_training.sources.selventa',
+                      '--help'],
+}
+
+#: Libraries that importing the package should not import
+LAZY_MODULES = ['bioregistry', 'pybel', 'pyobo']
+
+
+@click.command()
+@click.option('--repeats', default=5, show_default=True,
+              help='Number of times to time each command. The best is kept.')
+@click.option('--max-seconds', default=None, type=float,
+              help='Fail if any command takes longer than this, or if an'
+                   ' import loads one of the lazily loaded libraries.')
+@click.option('--output', default=None,
+              help='Path to write json results to. Printed if not given.')
+def main(repeats, max_seconds, output):
+    """Time package imports and CLI startup and write json results."""
+    results = run_startup_benchmark(repeats=repeats)
+    results_json = json.dumps(results, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(results_json)
+    else:
+        click.echo(results_json)
+    if max_seconds is None:
+        return
+    for name, result in results['commands'].items():
+        if result['seconds'] > max_seconds:
+            raise click.ClickException(
+                f'{name} took {result["seconds"]:.3f}s, more than'
+                f' {max_seconds}s')
+        if result.get('lazy_modules_loaded'):
+            raise click.ClickException(
+                f'{name} imported {", ".join(result["lazy_modules_loaded"])}')
+
+
+def run_startup_benchmark(commands=None, repeats=5):
+    """Time commands in fresh interpreters
+
+    Parameters
+    ----------
+    commands : Optional[dict]
+        dict mapping names to lists of arguments to the interpreter.
+        Default: COMMANDS
+    repeats : Optional[int]
+        Number of times to run each command. The fastest run is reported.
+        Default: 5
+
+    Returns
+    -------
+    dict
+        The best wall clock time of each command, and for commands that
+        import a module with -c, which of LAZY_MODULES it loaded.
+    """
+    commands = commands or COMMANDS
+    results = {}
+    for name, args in commands.items():
+        best = None
+        for _ in range(repeats):
+            seconds = _time_command(args)
+            if best is None or seconds < best:
+                best = seconds
+        results[name] = {'seconds': best}
+        if args[0] == '-c':
+            results[name]['lazy_modules_loaded'] = \
+                get_loaded_lazy_modules(args[1])
+    return {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'repeats': repeats,
+        'commands': results,
+    }
+
+
+def get_loaded_lazy_modules(code):
+    """Get which of LAZY_MODULES are imported by running code
+
+    Parameters
+    ----------
+    code : str
+        Python code to run in a fresh interpreter.
+
+    Returns
+    -------
+    list of str
+        The names in LAZY_MODULES that are in sys.modules afterwards.
+    """
+    check = f'{code}\nimport json, sys\n' \
+        f'print(json.dumps([name for name in {LAZY_MODULES!r}' \
+        f' if name in sys.modules]))'
+    stdout = subprocess.run([sys.executable, '-c', check], check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(stdout.decode('utf-8').splitlines()[-1])
+
+
+def _time_command(args):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Columnar files of causal triples used as input to dataset generation.
+
+Triples are stored in Parquet with one typed column per attribute, so that
+dataset generation can memory-map the file and read only the columns it
+needs instead of unpickling INDRA Statements. The statements themselves
+are kept as json in the statement1_json and statement2_json columns for
+consumers that need them.
+"""
+
+import json
+
+import pandas as pd
+
+#: Columns of a triples file, in order
+TRIPLES_COLUMNS = ['agent1', 'agent2', 'agent3',
+                   'agent1_name', 'agent2_name', 'agent3_name',
+                   'stmt_type1', 'stmt_type2',
+                   'statement1', 'statement2',
+                   'signor_id1', 'signor_id2',
+                   'signor_entity1', 'signor_entity2', 'signor_entity3',
+                   'pathway_filename',
+                   'statement1_json', 'statement2_json']
+
+
+def curie_from_db_refs(db_refs):
+    """Get curie for highest priority namespace in db_refs dict
+
+    Parameters
+    ----------
+    db_refs : dict
+        An INDRA style db_refs dict mapping namespaces to identifiers
+
+    Returns
+    -------
+    curie : str
+        A curie of the form f'{namespace}:{identifier}' associated to
+        the db_refs entry with namespace highest in the priority list
+        default_ns_order taken from `indra.statements.agent`. Chooses
+        a random db_refs entry for namespaces that do not appear in the
+        priority list. Returns None if given an empty db_refs dict.
+    """
+    # Only needed when triples are generated, not when they are read
+    from indra.statements.agent import default_ns_order
+    for namespace in default_ns_order:
+        if namespace in db_refs:
+            return f'{namespace}:{db_refs[namespace]}'
+    if db_refs:
+        # If db_refs has no namespaces from priority list, just return a
+        # random one
+        ns, id_ = list(db_refs.items())[0]
+        return f'{ns}:{id_}'
+    return None
+
+
+def get_triples_table(statements_df, statement_pairs=None):
+    """Convert a DataFrame of triples of statements to columnar form
+
+    Parameters
+    ----------
+    statements_df : pandas.DataFrame
+        DataFrame with columns signor_entity1, signor_entity2,
+        signor_entity3 and pathway_filename, and unless statement_pairs
+        is given, columns statement1 and statement2 holding the INDRA
+        Statements A -> B and B -> C. A pathway_filenames column listing
+        all pathways for each triple is kept if present.
+    statement_pairs : Optional[iterable of tuple]
+        Tuples of the form (statement1, statement2) for each row of
+        statements_df, such as a generator building them as they are
+        needed. Default: None
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame with columns TRIPLES_COLUMNS, followed by
+        pathway_filenames if present in the input, and the same index as
+        the input.
+    """
+    columns = {column: [] for column in TRIPLES_COLUMNS}
+    if statement_pairs is None:
+        statement_pairs = zip(statements_df.statement1,
+                              statements_df.statement2)
+    for statement1, statement2 in statement_pairs:
+        agents = (statement1.subj, statement1.obj, statement2.obj)
+        for position, agent in enumerate(agents, start=1):
+            columns[f'agent{position}'].append(
+                curie_from_db_refs(agent.db_refs))
+            columns[f'agent{position}_name'].append(agent.name)
+        for position, statement in enumerate((statement1, statement2),
+                                             start=1):
+            columns[f'stmt_type{position}'].append(type(statement).__name__)
+            columns[f'statement{position}'].append(str(statement))
+            columns[f'signor_id{position}'].append(
+                statement.evidence[0].source_id if statement.evidence
+                else None)
+            columns[f'statement{position}_json'].append(
+                json.dumps(statement.to_json()))
+    for column in ('signor_entity1', 'signor_entity2', 'signor_entity3',
+                   'pathway_filename'):
+        columns[column] = statements_df[column].tolist()
+    if 'pathway_filenames' in statements_df:
+        columns['pathway_filenames'] = \
+            statements_df['pathway_filenames'].tolist()
+    return pd.DataFrame(columns, index=statements_df.index)
+
+
+def write_triples(triples_df, path):
+    """Write a triples table as returned by get_triples_table to Parquet"""
+    triples_df.reset_index(drop=True).to_parquet(path, index=False)
+
+
+def read_triples(path, columns=None):
+    """Read columns of a triples file
+
+    The file is memory-mapped, so only the pages of the requested columns
+    are read from disk.
+
+    Parameters
+    ----------
+    path : str
+        Path to a file written by write_triples.
+    columns : Optional[list of str]
+        Columns to read. Default: all of TRIPLES_COLUMNS
+
+    Returns
+    -------
+    pandas.DataFrame
+        DataFrame whose index is the position of each triple in the file.
+    """
+    return pd.read_parquet(path, columns=columns, memory_map=True)
@@ -0,0 +1,74 @@
+"""Fixtures shared by the tests."""
+
+import random
+
+import pytest
+
+HEADER = [
+    'SET DOCUMENT Name = "synthetic"',
+    'SET DOCUMENT Version = "1.0.0"',
+    'SET DOCUMENT Authors = "tests"',
+    '',
+    'DEFINE NAMESPACE HGNC AS PATTERN ".*"',
+    'DEFINE NAMESPACE CHEBI AS PATTERN ".*"',
+    'DEFINE NAMESPACE SFAM AS PATTERN ".*"',
+    'DEFINE ANNOTATION Species AS LIST {"9606", "10090", "10116"}',
+    'DEFINE ANNOTATION Cell AS LIST {"hepatocyte", "neuron", "fibroblast"}',
+    '',
+]
+
+
+def _get_term(rng):
+    gene = f'G{rng.randrange(100)}'
+    return rng.choice([
+        f'p(HGNC:{gene})',
+        f'p(HGNC:{gene}, pmod(Ph))',
+        f'act(p(HGNC:{gene}), ma(kin))',
+        f'complex(p(HGNC:{gene}), p(HGNC:G{rng.randrange(100)}))',
+        f'a(CHEBI:"chem {rng.randrange(20)}")',
+        f'p(SFAM:"Fam {rng.randrange(10)}")',
+    ])
+
+
+def write_bel_script(path, n_statements, seed=0):
+    """Write a BEL script that exercises every kind of control statement"""
+    rng = random.Random(seed)
+    lines = list(HEADER)
+    for i in range(n_statements):
+        r = rng.random()
+        if r < 0.03:
+            lines.append(f'SET STATEMENT_GROUP = "group {i}"')
+        if r < 0.2:
+            lines.append(f'SET Citation = {{"PubMed", "{rng.randrange(10 ** 6)}"}}')
+            lines.append(f'SET Evidence = "evidence {i}"')
+            if rng.random() < 0.5:
+                lines.append(f'SET Species = "{rng.choice(["9606", "10090"])}"')
+            if rng.random() < 0.2:
+                lines.append('SET Cell = {"hepatocyte", "neuron"}')
+        elif r < 0.23:
+            lines.append(f'SET Evidence = "more evidence {i}"')
+        elif r < 0.25:
+            lines.append('UNSET Species')
+        elif r < 0.26:
+            lines.append('UNSET {Species, Cell}')
+        elif r < 0.265:
+            lines.append('UNSET ALL')
+        elif r < 0.27:
+            lines.append('SET Species = "bogus"')
+        elif r < 0.28:
+            lines.append('p(HGNC:broken -> ')
+        if rng.random() < 0.25:
+            # Nested statements give transitivities
+            lines.append(f'{_get_term(rng)} -> ({_get_term(rng)} -| {_get_term(rng)})')
+        else:
+            relation = rng.choice(['->', '-|', '=>', 'association'])
+            lines.append(f'{_get_term(rng)} {relation} {_get_term(rng)}')
+    path.write_text('\n'.join(lines) + '\n')
+
+
+@pytest.fixture
+def bel_script(tmp_path):
+    """Get the path of a synthetic BEL script with 600 statements"""
+    path = tmp_path / 'synthetic.bel'
+    write_bel_script(path, 600)
+    return path
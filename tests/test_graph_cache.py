@@ -0,0 +1,34 @@
+"""Tests for the on-disk cache of BEL graphs."""
+
+import pytest
+
+pybel = pytest.importorskip('pybel')
+
+from causal_precedence_training.sources.graph_cache import get_manifest, \
+    read_graph_cache, write_graph_cache
+from causal_precedence_training.sources.selventa import iter_transitive_rows
+
+
+def test_graph_cache_round_trip(bel_script, tmp_path):
+    graph = pybel.from_bel_script(bel_script.as_posix(), citation_clearing=False)
+    manifest = get_manifest(bel_script.as_posix())
+    directory = (tmp_path / 'graph_cache').as_posix()
+    write_graph_cache(graph, directory, manifest)
+    cached_graph = read_graph_cache(directory, manifest)
+
+    assert list(cached_graph) == list(graph)
+    assert list(cached_graph.edges(keys=True, data=True)) == list(graph.edges(keys=True, data=True))
+    assert cached_graph.transitivities == graph.transitivities
+    # Rows follow the order of the set of transitivities, which isn't kept
+    rows = sorted(iter_transitive_rows(graph))
+    assert rows
+    assert sorted(iter_transitive_rows(cached_graph)) == rows
+
+
+def test_graph_cache_is_stale_for_changed_script(bel_script, tmp_path):
+    graph = pybel.from_bel_script(bel_script.as_posix())
+    directory = (tmp_path / 'graph_cache').as_posix()
+    write_graph_cache(graph, directory, get_manifest(bel_script.as_posix()))
+    with open(bel_script, 'a') as file:
+        file.write('p(HGNC:G1) -> p(HGNC:G2)\n')
+    assert read_graph_cache(directory, get_manifest(bel_script.as_posix())) is None
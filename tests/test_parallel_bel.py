@@ -0,0 +1,41 @@
+"""Tests for parsing BEL scripts in parallel."""
+
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+pybel = pytest.importorskip('pybel')
+
+from causal_precedence_training.sources.parallel_bel import \
+    from_bel_script_parallel
+
+
+def _summarize(graph):
+    return {
+        'graph': graph.graph,
+        'nodelink': json.dumps(pybel.to_nodelink(graph), default=str),
+        'nodes': list(graph),
+        'edges': list(graph.edges(keys=True)),
+        'transitivities': sorted(graph.transitivities),
+        'warnings': [
+            (type(exc).__name__, str(exc), getattr(exc, 'line_number', None), json.dumps(context, default=str))
+            for _, exc, context in graph.warnings
+        ],
+    }
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('spawn')) as executor:
+        yield executor
+
+
+@pytest.mark.parametrize('citation_clearing', [False, True])
+@pytest.mark.parametrize('n_chunks', [1, 7])
+def test_from_bel_script_parallel_matches_serial(bel_script, executor, citation_clearing, n_chunks):
+    parallel_graph = from_bel_script_parallel(bel_script, executor, n_chunks=n_chunks, citation_clearing=citation_clearing)
+    serial_graph = pybel.from_bel_script(bel_script.as_posix(), citation_clearing=citation_clearing)
+    assert serial_graph.transitivities and serial_graph.warnings
+    assert _summarize(parallel_graph) == _summarize(serial_graph)
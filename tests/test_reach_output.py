@@ -0,0 +1,41 @@
+"""Tests for pairing sentences in reach_output."""
+
+import numpy as np
+import pytest
+
+from causal_precedence_training.reach_output import \
+    get_neighboring_sentence_pairs
+
+
+def _get_pairs_nested_loop(start_pos1, end_pos1, start_pos2, neighbor_cutoff,
+                           ordinal1, ordinal2, sentence_window):
+    # The pairing criterion as originally checked for every combination
+    return [(i, j) for i in range(len(start_pos1))
+            for j in range(len(start_pos2))
+            if start_pos1[i] == start_pos2[j] or
+            (end_pos1[i] > start_pos2[j] - neighbor_cutoff) and
+            (end_pos1[i] < start_pos2[j]) or
+            sentence_window is not None and
+            0 <= ordinal2[j] - ordinal1[i] <= sentence_window]
+
+
+@pytest.mark.parametrize('sentence_window', [None, 0, 1, 3])
+def test_get_neighboring_sentence_pairs_matches_nested_loop(sentence_window):
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        n1, n2 = rng.integers(0, 8, 2)
+        # Small ranges give many ties and sentences at the cutoff's edges
+        start_pos1 = rng.integers(0, 100, n1)
+        end_pos1 = start_pos1 + rng.integers(-3, 30, n1)
+        start_pos2 = rng.integers(0, 100, n2)
+        ordinal1 = rng.integers(0, 10, n1)
+        ordinal2 = rng.integers(0, 10, n2)
+        neighbor_cutoff = int(rng.integers(-5, 40))
+        idx1, idx2 = get_neighboring_sentence_pairs(
+            start_pos1, end_pos1, start_pos2, neighbor_cutoff,
+            ordinal1=ordinal1, ordinal2=ordinal2,
+            sentence_window=sentence_window)
+        expected = _get_pairs_nested_loop(start_pos1, end_pos1, start_pos2,
+                                          neighbor_cutoff, ordinal1, ordinal2,
+                                          sentence_window)
+        assert list(zip(idx1.tolist(), idx2.tolist())) == expected